@@ -122,6 +122,9 @@ def get_energy_history(country: str,
             raise IOError
 
     client = wideq.Client.load(state)
+    client.model_cache = wideq.ModelInfoCache.for_state_file(STATE_FILE)
+    # a long backfill is spread out instead of racing the plugin's polls
+    client.rate_limiter = wideq.RateLimiter.for_state_file(STATE_FILE)
     if country:
         client._country = country
     if language:
@@ -57,7 +57,7 @@ def ls(client):
     """List the user's devices."""
 
     try:
-        thinq1_devices = [dev for dev in client.devices if dev.platform_type == "thinq1"]
+        thinq1_devices = client.get_devices_by_platform("thinq1")
 
         if len(thinq1_devices) > 0:
             print("\nthinq1 devices: {}".format(len(thinq1_devices)))
@@ -67,7 +67,7 @@ def ls(client):
     except TypeError:
         print("No thinq1 devices found or there was some LG server error.")
 
-    thinq2_devices = [dev for dev in client.devices if dev.platform_type == "thinq2"]
+    thinq2_devices = client.get_devices_by_platform("thinq2")
 
     print("\nthinq2 devices: {}".format(len(thinq2_devices)))
     if len(thinq2_devices) > 0:
@@ -96,7 +96,7 @@ def gen_mon(client, device_id):
     device = client.get_device(device_id)
     model = client.model_info(device)
 
-    with wideq.Monitor(client.session, device_id) as mon:
+    with wideq.Monitor(client.session, device_id, client) as mon:
         try:
             while True:
                 time.sleep(1)
@@ -141,27 +141,32 @@ def ac_mon(ac):
         print("Device not available.")
         return
 
+    def show(state):
+        print(
+            "state {1}; "
+            "{0.mode.name}; "
+            "cur {0.temp_cur_c}°C; "
+            "cfg {0.temp_cfg_c}°C; "
+            "fan speed {0.fan_speed.name}; "
+            "energy {0.energy_on_current}".format(
+                state, "on" if state.is_on else "off"
+            )
+        )
+
+    # Print the status once, then only when the device reports a change.
+    subscription = ac.subscribe()
+    ac.client.start_polling()
     try:
-        while True:
-            time.sleep(1)
-            state = ac.poll()
-            if state:
-                print(
-                    "state {1}; "
-                    "{0.mode.name}; "
-                    "cur {0.temp_cur_c}°C; "
-                    "cfg {0.temp_cfg_c}°C; "
-                    "fan speed {0.fan_speed.name}; "
-                    "energy {0.energy_on_current}".format(
-                        state, "on" if state.is_on else "off"
-                    )
-                )
-            else:
-                print("no state. Wait 1 more second.")
+        show(ac.get_status())
+        for changes in subscription:
+            print("changed: {}".format(", ".join(sorted(changes))))
+            show(ac.get_status())
 
     except KeyboardInterrupt:
         pass
     finally:
+        subscription.cancel()
+        ac.client.stop_polling()
         ac.monitor_stop()
 
 
@@ -320,6 +325,8 @@ def example(country: str,
             raise IOError
 
     client = wideq.Client.load(state)
+    client.model_cache = wideq.ModelInfoCache.for_state_file(STATE_FILE)
+    client.rate_limiter = wideq.RateLimiter.for_state_file(STATE_FILE)
     if country:
         client._country = country
     if language:
@@ -353,7 +360,7 @@ def example(country: str,
             # sys.exit(2)
             raise AttributeError
 
-    thinq2_devices = [dev for dev in client.devices if dev.platform_type == "thinq2"]
+    thinq2_devices = client.get_devices_by_platform("thinq2")
     if len(thinq2_devices) > 0:
         # Save the updated state.
         state = client.dump()
@@ -41,7 +41,8 @@
                 <option label="Air to Water Heat Pump (AWHP)" value="type_awhp" default="false" />
             </options>
         </param>
-        <param field="Mode2" label="Device ID" width="270px"/>
+        <param field="Mode2" label="Device ID (empty for all devices)" width="270px"/>
+        <param field="Mode5" label="Poll intervals in s (fast;normal;slow)" width="150px" default="10;60;300"/>
     </params>
 </plugin>
 """
@@ -49,25 +50,93 @@
 import Domoticz
 import json
 import os.path
+import queue
+import threading
+import time
 
 import wideq
 
 
-class BasePlugin:
-    enabled = False
-    heartbeat_counter = 0
-    
-    ac_status = None
-    
-    def __init__(self):
-        # values will be filled in with onStart function
-        self.DEVICE_TYPE = ""
-        self.DEVICE_ID = ""
-        self.COUNTRY = ""
-        self.LANGUAGE = ""
-        self.DEBUG = ""
+# Polling intervals in seconds, configurable as "fast;normal;slow" in Mode5.
+DEFAULT_POLL_INTERVALS = (10, 60, 300)
+# Poll at the fast rate for this long after a command, to confirm it.
+FAST_POLL_WINDOW = 60
+# Back off to the slow rate when nothing has changed for this long.
+IDLE_TIMEOUT = 600
+# Seconds a poll or command of the worker may take, retries included.
+TASK_DEADLINE = 20
+# Seconds onStop lets the running task finish before cancelling it.
+STOP_GRACE_TIME = 5
+
+
+class PollScheduler:
+    """Decides when to poll next, based on monotonic time.
+
+    Polls fast right after a command, at the normal rate while a device
+    runs and its data changes, and slowly when everything is off or idle.
+    """
+
+    def __init__(self, fast, normal, slow):
+        self.fast = fast
+        self.normal = normal
+        self.slow = slow
+
+        now = time.monotonic()
+        self.next_poll = now
+        self.fast_until = 0
+        self.last_change = now
+
+    @classmethod
+    def from_parameter(cls, value):
+        try:
+            fast, normal, slow = (int(x) for x in value.split(";"))
+            if not 0 < fast <= normal <= slow:
+                raise ValueError
+        except ValueError:
+            if value.strip() != "":
+                Domoticz.Error("Invalid poll intervals '" + value + "', using defaults.")
+            fast, normal, slow = DEFAULT_POLL_INTERVALS
+        return cls(fast, normal, slow)
+
+    def due(self):
+        return time.monotonic() >= self.next_poll
+
+    def command_sent(self):
+        now = time.monotonic()
+        self.fast_until = now + FAST_POLL_WINDOW
+        self.next_poll = min(self.next_poll, now + self.fast)
+
+    def polled(self, changed=False, running=True):
+        now = time.monotonic()
+        if changed:
+            self.last_change = now
+
+        if now < self.fast_until:
+            interval = self.fast
+        elif not running or now - self.last_change > IDLE_TIMEOUT:
+            interval = self.slow
+        else:
+            interval = self.normal
+        self.next_poll = now + interval
+
+
+# Domoticz units reserved for every LG device in multi-device mode. The
+# device in slot N (counting from 0) owns units N*UNITS_PER_DEVICE+1 and up.
+UNITS_PER_DEVICE = 10
+MAX_UNIT = 255
+
+
+class Appliance:
+    """Domoticz units of a single LG device and their last known state."""
+
+    def __init__(self, plugin, lg_device, device_type, base=0):
+        self.plugin = plugin
+        self.lg_device = lg_device
+        self.device_id = lg_device.device.id
+        self.DEVICE_TYPE = device_type
+        # Domoticz unit number = base + local unit number (1-7)
+        self.base = base
 
-        self.device_id = ""
         self.operation = ""
         self.op_mode = ""
         self.target_temp = ""
@@ -81,59 +150,39 @@ class BasePlugin:
         self.v_step = ""
         # self.power = ""
 
-        self.lg_device = None
-        self.state = {}
-
-    def onStart(self):
-        # these variables definitions has to be here (onStart)
-        self.DEVICE_TYPE = Parameters["Mode1"]
-        self.DEVICE_ID = Parameters["Mode2"]
-        self.COUNTRY = Parameters["Mode3"]
-        self.LANGUAGE = Parameters["Mode4"]
-        self.DEBUG = Parameters["Mode6"]
-
-        if self.DEBUG == "Debug":
-            Domoticz.Debugging(1)
-
-        self.wideq_object = WideQ(country=self.COUNTRY,
-                                  language=self.LANGUAGE)
+    def unit(self, number):
+        return Devices[self.base + number]
 
-        if self.wideq_object.state_file == "":
-            return False
-
-        # import web_pdb; web_pdb.set_trace()
-
-        try:
-            # read AC parameters and Client state
-            self.lg_device = self.wideq_object.operate_device(device_id=self.DEVICE_ID)
-
-        except UserWarning:
-            Domoticz.Error("Device not found on your LG account. Check your device ID.")
-
-        if self.lg_device is None:
-            return False
+    def create_device(self, Name, Unit, **kwargs):
+        if self.base + Unit in Devices:
+            return
+        if self.plugin.multi_device:
+            Name = self.lg_device.device.name + " - " + Name
+            kwargs["DeviceID"] = self.device_id
+        Domoticz.Device(Name=Name, Unit=self.base + Unit, **kwargs).Create()
 
+    def create_devices(self):
         # AC part
         if self.DEVICE_TYPE == "type_ac":
             Domoticz.Log("Getting AC status successful.")
-            if len(Devices) == 0:
-                Domoticz.Device(Name="Operation", Unit=1, Image=16, TypeName="Switch", Used=1).Create()
+            if self.base + 1 not in Devices:
+                self.create_device(Name="Operation", Unit=1, Image=16, TypeName="Switch", Used=1)
                 
                 Options = {"LevelActions" : "|||||",
                            "LevelNames" : "|Auto|Cool|Heat|Fan|Dry",
                            "LevelOffHidden" : "true",
                            "SelectorStyle" : "0"}
                            
-                Domoticz.Device(Name="Mode", Unit=2, TypeName="Selector Switch", Image=16, Options=Options, Used=1).Create()
-                Domoticz.Device(Name="Target temp", Unit=3, Type=242, Subtype=1, Image=15, Used=1).Create()
-                Domoticz.Device(Name="Room temp", Unit=4, TypeName="Temperature", Used=1).Create()
+                self.create_device(Name="Mode", Unit=2, TypeName="Selector Switch", Image=16, Options=Options, Used=1)
+                self.create_device(Name="Target temp", Unit=3, Type=242, Subtype=1, Image=15, Used=1)
+                self.create_device(Name="Room temp", Unit=4, TypeName="Temperature", Used=1)
                 
                 Options = {"LevelActions" : "|||||||",
                            "LevelNames" : "|Auto|L2|L3|L4|L5|L6",
                            "LevelOffHidden" : "true",
                            "SelectorStyle" : "0"}
                            
-                Domoticz.Device(Name="Fan speed", Unit=5, TypeName="Selector Switch", Image=7, Options=Options, Used=1).Create()
+                self.create_device(Name="Fan speed", Unit=5, TypeName="Selector Switch", Image=7, Options=Options, Used=1)
                 
                 
                 Options = {"LevelActions" : "||||||||||",
@@ -141,7 +190,7 @@ class BasePlugin:
                            "LevelOffHidden" : "true",
                            "SelectorStyle" : "1"}
                            
-                Domoticz.Device(Name="Swing Horizontal", Unit=6, TypeName="Selector Switch", Image=7, Options=Options, Used=1).Create()
+                self.create_device(Name="Swing Horizontal", Unit=6, TypeName="Selector Switch", Image=7, Options=Options, Used=1)
                 
                 
                 Options = {"LevelActions" : "|||||||||",
@@ -149,48 +198,47 @@ class BasePlugin:
                            "LevelOffHidden" : "true",
                            "SelectorStyle" : "1"}
                            
-                Domoticz.Device(Name="Swing Vertical", Unit=7, TypeName="Selector Switch", Image=7, Options=Options, Used=1).Create()
-                # Domoticz.Device(Name="Power", Unit=8, TypeName="kWh", Used=1).Create()
+                self.create_device(Name="Swing Vertical", Unit=7, TypeName="Selector Switch", Image=7, Options=Options, Used=1)
+                # self.create_device(Name="Power", Unit=8, TypeName="kWh", Used=1)
                 
                 Domoticz.Log("LG ThinQ AC device created.")
                 
         # AWHP part
         elif self.DEVICE_TYPE == "type_awhp":
             Domoticz.Log("Getting AWHP status successful.")
-            if len(Devices) == 0:
-                Domoticz.Device(Name="Operation", Unit=1, Image=16, TypeName="Switch", Used=1).Create()
+            if self.base + 1 not in Devices:
+                self.create_device(Name="Operation", Unit=1, Image=16, TypeName="Switch", Used=1)
                 
                 Options = {"LevelActions" : "||||",
                            "LevelNames" : "|Cool|AI|Heat",
                            "LevelOffHidden" : "true",
                            "SelectorStyle" : "0"}
                            
-                Domoticz.Device(Name="Mode", Unit=2, TypeName="Selector Switch", Image=16, Options=Options, Used=1).Create()
-                Domoticz.Device(Name="Target temp", Unit=3, Type=242, Subtype=1, Image=15, Used=1).Create()
-                Domoticz.Device(Name="Hot water temp", Unit=4, Type=242, Subtype=1, Image=15, Used=1).Create()
-                Domoticz.Device(Name="Input water temp", Unit=5, TypeName="Temperature", Used=1).Create()
-                Domoticz.Device(Name="Output water temp", Unit=6, TypeName="Temperature", Used=1).Create()
-                Domoticz.Device(Name="DHW water temp", Unit=7, TypeName="Temperature", Used=1).Create()
+                self.create_device(Name="Mode", Unit=2, TypeName="Selector Switch", Image=16, Options=Options, Used=1)
+                self.create_device(Name="Target temp", Unit=3, Type=242, Subtype=1, Image=15, Used=1)
+                self.create_device(Name="Hot water temp", Unit=4, Type=242, Subtype=1, Image=15, Used=1)
+                self.create_device(Name="Input water temp", Unit=5, TypeName="Temperature", Used=1)
+                self.create_device(Name="Output water temp", Unit=6, TypeName="Temperature", Used=1)
+                self.create_device(Name="DHW water temp", Unit=7, TypeName="Temperature", Used=1)
                 
                 Domoticz.Log("LG ThinQ AWHP device created.") 
         else:
             Domoticz.Error("Getting LG device status failed.")
 
-        DumpConfigToLog()
+    def send_command(self, name, *args):
+        self.plugin.send_command(self.device_id, name, *args)
 
-    def onStop(self):
-        Domoticz.Log("onStop called")
-        
-    def onConnect(self, Connection, Status, Description):
-        pass
+    def set_control(self, key, value):
+        """Set a control of the LG device. Quick successive changes (e.g. slider drags) are sent once, with the last value.
+        Returns False if the device does not support the value."""
+        try:
+            self.plugin.coalescer.set(self.lg_device, key, value)
+        except ValueError as e:
+            Domoticz.Error("Value not supported by LG device: " + str(e))
+            return False
+        return True
 
-    def onMessage(self, Connection, Data):
-        # Domoticz.Log("onMessage called with: "+Data["Verb"])
-        # DumpDictionaryToLog(Data)
-        
-        pass
-            
-    def onCommand(self, Unit, Command, Level, Hue):
+    def on_command(self, Unit, Command, Level):
         # Domoticz.Debug("Command received U="+str(Unit)+" C="+str(Command)+" L= "+str(Level)+" H= "+str(Hue))
         # import web_pdb; web_pdb.set_trace()
         
@@ -199,94 +247,94 @@ class BasePlugin:
             if Unit == 1: # Operation
                 if Command == "On":
                     self.operation = 1
-                    self.lg_device.set_on(True)
-                    Devices[1].Update(nValue = 1, sValue = "100") 
+                    self.send_command("set_on", True)
+                    self.unit(1).Update(nValue = 1, sValue = "100") 
                 else:
                     self.operation = 0
-                    self.lg_device.set_on(False)
-                    Devices[1].Update(nValue = 0, sValue = "0") 
+                    self.send_command("set_on", False)
+                    self.unit(1).Update(nValue = 0, sValue = "0") 
                     
             if Unit == 2: # opMode
                 newImage = 16
                 if Level == 10:
-                    self.lg_device.set_mode(wideq.ACMode.ACO)
+                    self.send_command("set_mode", wideq.ACMode.ACO)
                     newImage = 16
                 elif Level == 20:
-                    self.lg_device.set_mode(wideq.ACMode.COOL)
+                    self.send_command("set_mode", wideq.ACMode.COOL)
                     newImage = 16
                 elif Level == 30:
-                    self.lg_device.set_mode(wideq.ACMode.HEAT)
+                    self.send_command("set_mode", wideq.ACMode.HEAT)
                     newImage = 15
                 elif Level == 40:
-                    self.lg_device.set_mode(wideq.ACMode.FAN)
+                    self.send_command("set_mode", wideq.ACMode.FAN)
                     newImage = 7
                 elif Level == 50:
-                    self.lg_device.set_mode(wideq.ACMode.DRY)
+                    self.send_command("set_mode", wideq.ACMode.DRY)
                     newImage = 16
-                Devices[2].Update(nValue = self.operation, sValue = str(Level), Image = newImage)
+                self.unit(2).Update(nValue = self.operation, sValue = str(Level), Image = newImage)
                     
             if Unit == 3: # SetPoint
                 # import web_pdb; web_pdb.set_trace()
-                if Devices[3].nValue != self.operation or Devices[3].sValue != Level:
-                    self.lg_device.set_celsius(int(Level))
-                    Domoticz.Log("new Setpoint: " + str(Level))
-                    Devices[3].Update(nValue = self.operation, sValue = str(Level))
+                if self.unit(3).nValue != self.operation or self.unit(3).sValue != Level:
+                    if self.set_control("airState.tempState.target", int(Level)):
+                        Domoticz.Log("new Setpoint: " + str(Level))
+                        self.unit(3).Update(nValue = self.operation, sValue = str(Level))
                     
             if Unit == 5: # Fan speed
                 # import web_pdb; web_pdb.set_trace()
                 if Level == 10:
-                    self.lg_device.set_fan_speed(wideq.ACFanSpeed.NATURE)
+                    self.send_command("set_fan_speed", wideq.ACFanSpeed.NATURE)
                 elif Level == 20:
-                    self.lg_device.set_fan_speed(wideq.ACFanSpeed.LOW)
+                    self.send_command("set_fan_speed", wideq.ACFanSpeed.LOW)
                 elif Level == 30:
-                    self.lg_device.set_fan_speed(wideq.ACFanSpeed.LOW_MID)
+                    self.send_command("set_fan_speed", wideq.ACFanSpeed.LOW_MID)
                 elif Level == 40:
-                    self.lg_device.set_fan_speed(wideq.ACFanSpeed.MID)
+                    self.send_command("set_fan_speed", wideq.ACFanSpeed.MID)
                 elif Level == 50:
-                    self.lg_device.set_fan_speed(wideq.ACFanSpeed.MID_HIGH)
+                    self.send_command("set_fan_speed", wideq.ACFanSpeed.MID_HIGH)
                 elif Level == 60:
-                    self.lg_device.set_fan_speed(wideq.ACFanSpeed.HIGH)
-                Devices[5].Update(nValue = self.operation, sValue = str(Level))
+                    self.send_command("set_fan_speed", wideq.ACFanSpeed.HIGH)
+                self.unit(5).Update(nValue = self.operation, sValue = str(Level))
                     
             if Unit == 6: # Swing horizontal
                 if Level == 10:
-                    self.lg_device.set_horz_swing(wideq.ACHSwingMode.ALL)
+                    self.send_command("set_horz_swing", wideq.ACHSwingMode.ALL)
                 elif Level == 20:
-                    self.lg_device.set_horz_swing(wideq.ACHSwingMode.OFF)
+                    self.send_command("set_horz_swing", wideq.ACHSwingMode.OFF)
                 elif Level == 30:
-                    self.lg_device.set_horz_swing(wideq.ACHSwingMode.ONE)
+                    self.send_command("set_horz_swing", wideq.ACHSwingMode.ONE)
                 elif Level == 40:
-                    self.lg_device.set_horz_swing(wideq.ACHSwingMode.TWO)
+                    self.send_command("set_horz_swing", wideq.ACHSwingMode.TWO)
                 elif Level == 50:
-                    self.lg_device.set_horz_swing(wideq.ACHSwingMode.THREE)
+                    self.send_command("set_horz_swing", wideq.ACHSwingMode.THREE)
                 elif Level == 60:
-                    self.lg_device.set_horz_swing(wideq.ACHSwingMode.FOUR)
+                    self.send_command("set_horz_swing", wideq.ACHSwingMode.FOUR)
                 elif Level == 70:
-                    self.lg_device.set_horz_swing(wideq.ACHSwingMode.FIVE)
+                    self.send_command("set_horz_swing", wideq.ACHSwingMode.FIVE)
                 elif Level == 80:
-                    self.lg_device.set_horz_swing(wideq.ACHSwingMode.LEFT_HALF)
+                    self.send_command("set_horz_swing", wideq.ACHSwingMode.LEFT_HALF)
                 elif Level == 90:
-                    self.lg_device.set_horz_swing(wideq.ACHSwingMode.RIGHT_HALF)
-                Devices[6].Update(nValue = self.operation, sValue = str(Level))
+                    self.send_command("set_horz_swing", wideq.ACHSwingMode.RIGHT_HALF)
+                self.unit(6).Update(nValue = self.operation, sValue = str(Level))
                     
             if Unit == 7: # Swing vertical
                 if Level == 10:
-                    self.lg_device.set_vert_swing(wideq.ACVSwingMode.ALL)
+                    self.send_command("set_vert_swing", wideq.ACVSwingMode.ALL)
                 elif Level == 20:
-                    self.lg_device.set_vert_swing(wideq.ACVSwingMode.OFF)
+                    self.send_command("set_vert_swing", wideq.ACVSwingMode.OFF)
                 elif Level == 30:
-                    self.lg_device.set_vert_swing(wideq.ACVSwingMode.ONE)
+                    self.send_command("set_vert_swing", wideq.ACVSwingMode.ONE)
                 elif Level == 40:
-                    self.lg_device.set_vert_swing(wideq.ACVSwingMode.TWO)
+                    self.send_command("set_vert_swing", wideq.ACVSwingMode.TWO)
                 elif Level == 50:
-                    self.lg_device.set_vert_swing(wideq.ACVSwingMode.THREE)
+                    self.send_command("set_vert_swing", wideq.ACVSwingMode.THREE)
                 elif Level == 60:
-                    self.lg_device.set_vert_swing(wideq.ACVSwingMode.FOUR)
+                    self.send_command("set_vert_swing", wideq.ACVSwingMode.FOUR)
                 elif Level == 70:
-                    self.lg_device.set_vert_swing(wideq.ACVSwingMode.FIVE)
+                    self.send_command("set_vert_swing", wideq.ACVSwingMode.FIVE)
                 elif Level == 80:
-                    self.lg_device.set_vert_swing(wideq.ACVSwingMode.SIX)
-                Devices[7].Update(nValue = self.operation, sValue = str(Level))
+                    self.send_command("set_vert_swing", wideq.ACVSwingMode.SIX)
+                self.unit(7).Update(nValue = self.operation, sValue = str(Level))
                 
             
         # AWHP part
@@ -294,108 +342,94 @@ class BasePlugin:
             if Unit == 1: # Operation
                 if Command == "On":
                     self.operation = 1
-                    self.lg_device.set_on(True)
-                    Devices[1].Update(nValue = 1, sValue = "100") 
+                    self.send_command("set_on", True)
+                    self.unit(1).Update(nValue = 1, sValue = "100") 
                 else:
                     self.operation = 0
-                    self.lg_device.set_on(False)
-                    Devices[1].Update(nValue = 0, sValue = "0") 
+                    self.send_command("set_on", False)
+                    self.unit(1).Update(nValue = 0, sValue = "0") 
                     
             if Unit == 2: # opMode
                 newImage = 16
                 if Level == 10:
-                    self.lg_device.set_mode(wideq.ACMode.COOL)
+                    self.send_command("set_mode", wideq.ACMode.COOL)
                     newImage = 16
                 elif Level == 20:
-                    self.lg_device.set_mode(wideq.ACMode.AI)
+                    self.send_command("set_mode", wideq.ACMode.AI)
                     newImage = 16
                 elif Level == 30:
-                    self.lg_device.set_mode(wideq.ACMode.HEAT)
+                    self.send_command("set_mode", wideq.ACMode.HEAT)
                     newImage = 15
-                Devices[2].Update(nValue = self.operation, sValue = str(Level), Image = newImage)
+                self.unit(2).Update(nValue = self.operation, sValue = str(Level), Image = newImage)
                     
             if Unit == 3: # Target temp
-                if Devices[3].nValue != self.operation or Devices[3].sValue != Level:
-                    self.lg_device.set_celsius(int(Level))
-                    Domoticz.Log("new Target temp: " + str(Level))
-                    Devices[3].Update(nValue = self.operation, sValue = str(Level))
+                if self.unit(3).nValue != self.operation or self.unit(3).sValue != Level:
+                    if self.set_control("airState.tempState.target", int(Level)):
+                        Domoticz.Log("new Target temp: " + str(Level))
+                        self.unit(3).Update(nValue = self.operation, sValue = str(Level))
                     
             if Unit == 4: # Hot water temp
-                if Devices[4].nValue != self.operation or Devices[4].sValue != Level:
-                    self.lg_device.set_hot_water(int(Level))
-                    Domoticz.Log("new Hot water Target temp: " + str(Level))
-                    Devices[4].Update(nValue = self.operation, sValue = str(Level))
+                if self.unit(4).nValue != self.operation or self.unit(4).sValue != Level:
+                    if self.set_control("airState.tempState.hotWaterTarget", int(Level)):
+                        Domoticz.Log("new Hot water Target temp: " + str(Level))
+                        self.unit(4).Update(nValue = self.operation, sValue = str(Level))
         
-    def onDisconnect(self, Connection):
-        Domoticz.Log("onDisconnect called")
+    def values(self):
+        return (self.operation, self.op_mode, self.target_temp, self.hot_water_temp, self.room_temp,
+                self.in_water_temp, self.out_water_temp, self.DHW_water_temp, self.wind_strength,
+                self.h_step, self.v_step)
+
+    def apply_status(self, status):
+        """Update the Domoticz units from a status. Returns True if any value changed."""
+        previous = self.values()
+        self.lg_device_status = status
+
+        # AC part
+        if self.DEVICE_TYPE == "type_ac":
+            self.operation = self.lg_device_status.is_on
+            if self.operation:
+                self.operation = 1
+            else:
+                self.operation = 0
+
+            self.op_mode = self.lg_device_status.mode.name
+            self.target_temp = str(self.lg_device_status.temp_cfg_c)
+            self.room_temp = str(self.lg_device_status.temp_cur_c)
+            self.wind_strength = self.lg_device_status.fan_speed.name
+            self.h_step = self.lg_device_status.horz_swing.name
+            self.v_step = self.lg_device_status.vert_swing.name
+            # self.power = str(self.lg_device_status.energy_on_current)
+
+        # AWHP part
+        if self.DEVICE_TYPE == "type_awhp":
+            self.operation = self.lg_device_status.is_on
+            if self.operation:
+                self.operation = 1
+            else:
+                self.operation = 0
+
+            self.op_mode = self.lg_device_status.mode.name
+            self.target_temp = str(self.lg_device_status.temp_cfg_c)
+            self.hot_water_temp = str(self.lg_device_status.temp_hot_water_cfg_c)
+            self.in_water_temp = str(self.lg_device_status.in_water_cur_c)
+            self.out_water_temp = str(self.lg_device_status.out_water_cur_c)
+            self.DHW_water_temp = str(self.lg_device_status.temp_hot_water_cur_c)
+
+        self.update_domoticz()
+        return self.values() != previous
 
-    # every 10 seconds
-    # +heartbeat_counter 6 times which gives polling every 60 seconds.
-    def onHeartbeat(self):
-        # Domoticz.Log("onHeartbeat called: "+str(self.heartbeat_counter))
-        if self.heartbeat_counter == 0:
-            # Domoticz.Log("heartbeat_counter: "+str(self.heartbeat_counter))
-            # import web_pdb; web_pdb.set_trace()
-            # to check if self.lg_device has been already read out from server
-            if self.lg_device is not None:
-        
-                try:
-                    self.lg_device_status = self.lg_device.get_status()
-                    
-                    # AC part
-                    if self.DEVICE_TYPE == "type_ac":
-                        self.operation = self.lg_device_status.is_on
-                        if self.operation:
-                            self.operation = 1
-                        else:
-                            self.operation = 0
-                            
-                        self.op_mode = self.lg_device_status.mode.name
-                        self.target_temp = str(self.lg_device_status.temp_cfg_c)
-                        self.room_temp = str(self.lg_device_status.temp_cur_c)
-                        self.wind_strength = self.lg_device_status.fan_speed.name
-                        self.h_step = self.lg_device_status.horz_swing.name
-                        self.v_step = self.lg_device_status.vert_swing.name
-                        # self.power = str(self.lg_device_status.energy_on_current)
-                        
-                    # AWHP part
-                    if self.DEVICE_TYPE == "type_awhp":
-                        self.operation = self.lg_device_status.is_on
-                        if self.operation:
-                            self.operation = 1
-                        else:
-                            self.operation = 0
-                            
-                        self.op_mode = self.lg_device_status.mode.name
-                        self.target_temp = str(self.lg_device_status.temp_cfg_c)
-                        self.hot_water_temp = str(self.lg_device_status.temp_hot_water_cfg_c)
-                        self.in_water_temp = str(self.lg_device_status.in_water_cur_c)
-                        self.out_water_temp = str(self.lg_device_status.out_water_cur_c)
-                        self.DHW_water_temp = str(self.lg_device_status.temp_hot_water_cur_c)
-                        
-                    self.update_domoticz()
-                        
-                except wideq.NotLoggedInError:
-            
-                    # read AC parameters and Client state
-                    self.lg_device = self.wideq_object.operate_device(device_id=self.DEVICE_ID)
-                            
-        self.heartbeat_counter = self.heartbeat_counter + 1
-        if self.heartbeat_counter > 5:
-            self.heartbeat_counter = 0
-        
     def update_domoticz(self):
         # import web_pdb; web_pdb.set_trace()
         # AC part
         if self.DEVICE_TYPE == "type_ac":
             # Operation
             if self.operation == 0:
-                if Devices[1].nValue != 0:
-                    Devices[1].Update(nValue = 0, sValue ="0") 
+                if self.unit(1).nValue != 0:
+                    self.unit(1).Update(nValue = 0, sValue ="0") 
                     Domoticz.Log("operation received! Current: " + str(self.operation))
             else:
-                if Devices[1].nValue != 1:
-                    Devices[1].Update(nValue = 1, sValue ="100")
+                if self.unit(1).nValue != 1:
+                    self.unit(1).Update(nValue = 1, sValue ="100")
                     Domoticz.Log("operation received! Current: " + str(self.operation))
                 
             # Mode (opMode)
@@ -415,21 +449,21 @@ class BasePlugin:
                 sValueNew = "50" #Dry
                 newImage = 16
                 
-            if Devices[2].nValue != self.operation or Devices[2].sValue != sValueNew:
-                Devices[2].Update(nValue = self.operation, sValue = sValueNew, Image = newImage)
+            if self.unit(2).nValue != self.operation or self.unit(2).sValue != sValueNew:
+                self.unit(2).Update(nValue = self.operation, sValue = sValueNew, Image = newImage)
                 Domoticz.Log("Mode received! Current: " + self.op_mode)
                 
             # Target temp (tempState.target)
-            if Devices[3].nValue != self.operation or Devices[3].sValue != self.target_temp:
-                Devices[3].Update(nValue = self.operation, sValue = self.target_temp)
+            if self.unit(3).nValue != self.operation or self.unit(3).sValue != self.target_temp:
+                self.unit(3).Update(nValue = self.operation, sValue = self.target_temp)
                 Domoticz.Log("tempState.target received! Current: " + self.target_temp)
                     
             # Room temp (tempState.current)
-            if Devices[4].sValue != self.room_temp:
-                Devices[4].Update(nValue = 0, sValue = self.room_temp)
+            if self.unit(4).sValue != self.room_temp:
+                self.unit(4).Update(nValue = 0, sValue = self.room_temp)
                 Domoticz.Log("tempState.current received! Current: " + self.room_temp)
             # else:
-                # Domoticz.Log("Devices[4].sValue=" + Devices[4].sValue)
+                # Domoticz.Log("self.unit(4).sValue=" + self.unit(4).sValue)
                 # Domoticz.Log("room_temp=" + self.room_temp)
                 
             # Fan speed (windStrength)
@@ -446,8 +480,8 @@ class BasePlugin:
             elif self.wind_strength == "HIGH":
                 sValueNew = "60" #6
                     
-            if Devices[5].nValue != self.operation or Devices[5].sValue != sValueNew:
-                Devices[5].Update(nValue = self.operation, sValue = sValueNew)
+            if self.unit(5).nValue != self.operation or self.unit(5).sValue != sValueNew:
+                self.unit(5).Update(nValue = self.operation, sValue = sValueNew)
                 Domoticz.Log("windStrength received! Current: " + self.wind_strength)
                 
             # Swing Horizontal (hStep)
@@ -470,8 +504,8 @@ class BasePlugin:
             elif self.h_step == "OFF":
                 sValueNew = "20" #None
                 
-            if Devices[6].nValue != self.operation or Devices[6].sValue != sValueNew:
-                Devices[6].Update(nValue = self.operation, sValue = sValueNew)
+            if self.unit(6).nValue != self.operation or self.unit(6).sValue != sValueNew:
+                self.unit(6).Update(nValue = self.operation, sValue = sValueNew)
                 Domoticz.Log("hStep received! Current: " + self.h_step)
                 
             # Swing Vertival (vStep)
@@ -492,26 +526,26 @@ class BasePlugin:
             elif self.v_step == "SIX":
                 sValueNew = "80" #Bottom
                 
-            if Devices[7].nValue != self.operation or Devices[7].sValue != sValueNew:
-                Devices[7].Update(nValue = self.operation, sValue = sValueNew)
+            if self.unit(7).nValue != self.operation or self.unit(7).sValue != sValueNew:
+                self.unit(7).Update(nValue = self.operation, sValue = sValueNew)
                 Domoticz.Log("vStep received! Current: " + self.v_step)
                 
             # Current Power (energy.onCurrent)
-            # if (Devices[8].sValue != (str(self.power) + ";0")):
+            # if (self.unit(8).sValue != (str(self.power) + ";0")):
                 # import web_pdb; web_pdb.set_trace()
-                # Devices[8].Update(nValue = self.operation, sValue = self.power + ";0")
+                # self.unit(8).Update(nValue = self.operation, sValue = self.power + ";0")
                 # Domoticz.Log("power received! Current: " + self.power)
 
         # AWHP part
         if self.DEVICE_TYPE == "type_awhp":
             # Operation
             if self.operation == 0:
-                if Devices[1].nValue != 0:
-                    Devices[1].Update(nValue = 0, sValue ="0") 
+                if self.unit(1).nValue != 0:
+                    self.unit(1).Update(nValue = 0, sValue ="0") 
                     Domoticz.Log("operation received! Current: " + str(self.operation))
             else:
-                if Devices[1].nValue != 1:
-                    Devices[1].Update(nValue = 1, sValue ="100")
+                if self.unit(1).nValue != 1:
+                    self.unit(1).Update(nValue = 1, sValue ="100")
                     Domoticz.Log("operation received! Current: " + str(self.operation))
                 
             # Mode (opMode)
@@ -525,35 +559,290 @@ class BasePlugin:
                 sValueNew = "30" #Heat
                 newImage = 15
                 
-            if Devices[2].nValue != self.operation or Devices[2].sValue != sValueNew:
-                Devices[2].Update(nValue = self.operation, sValue = sValueNew, Image = newImage)
+            if self.unit(2).nValue != self.operation or self.unit(2).sValue != sValueNew:
+                self.unit(2).Update(nValue = self.operation, sValue = sValueNew, Image = newImage)
                 Domoticz.Log("Mode received! Current: " + self.op_mode)
                 
             # Target temp (tempState.target)
-            if Devices[3].nValue != self.operation or Devices[3].sValue != self.target_temp:
-                Devices[3].Update(nValue = self.operation, sValue = self.target_temp)
+            if self.unit(3).nValue != self.operation or self.unit(3).sValue != self.target_temp:
+                self.unit(3).Update(nValue = self.operation, sValue = self.target_temp)
                 Domoticz.Log("tempState.target received! Current: " + self.target_temp)
                 
             # Hot water temp (airState.tempState.hotWaterCurrent)
-            if Devices[4].nValue != self.operation or Devices[4].sValue != self.hot_water_temp:
-                Devices[4].Update(nValue = self.operation, sValue = self.hot_water_temp)
+            if self.unit(4).nValue != self.operation or self.unit(4).sValue != self.hot_water_temp:
+                self.unit(4).Update(nValue = self.operation, sValue = self.hot_water_temp)
                 Domoticz.Log("airState.tempState.hotWaterCurrent received! Current: " + self.hot_water_temp)
                 
             # Input water temp (tempState.inWaterCurrent)
-            if Devices[5].nValue != self.operation or Devices[5].sValue != self.in_water_temp:
-                Devices[5].Update(nValue = self.operation, sValue = self.in_water_temp)
+            if self.unit(5).nValue != self.operation or self.unit(5).sValue != self.in_water_temp:
+                self.unit(5).Update(nValue = self.operation, sValue = self.in_water_temp)
                 Domoticz.Log("tempState.inWaterCurrent received! Current: " + self.in_water_temp)
                 
             # Output water temp (tempState.outWaterCurrent)
-            if Devices[6].nValue != self.operation or Devices[6].sValue != self.out_water_temp:
-                Devices[6].Update(nValue = self.operation, sValue = self.out_water_temp)
+            if self.unit(6).nValue != self.operation or self.unit(6).sValue != self.out_water_temp:
+                self.unit(6).Update(nValue = self.operation, sValue = self.out_water_temp)
                 Domoticz.Log("tempState.outWaterCurrent received! Current: " + self.out_water_temp)
 
             # DHW water temp (tempState.hotWaterCurrent)
-            if Devices[7].nValue != self.operation or Devices[7].sValue != self.DHW_water_temp:
-                Devices[7].Update(nValue = self.operation, sValue = self.DHW_water_temp)
+            if self.unit(7).nValue != self.operation or self.unit(7).sValue != self.DHW_water_temp:
+                self.unit(7).Update(nValue = self.operation, sValue = self.DHW_water_temp)
                 Domoticz.Log("tempState.hotWaterCurrent received! Current: " + self.DHW_water_temp)
 
+
+class BasePlugin:
+    enabled = False
+    
+    def __init__(self):
+        # values will be filled in with onStart function
+        self.DEVICE_TYPE = ""
+        self.DEVICE_ID = ""
+        self.COUNTRY = ""
+        self.LANGUAGE = ""
+        self.DEBUG = ""
+
+        # one hardware entry can manage all devices of the LG account
+        self.multi_device = False
+        # device ID -> Appliance
+        self.appliances = {}
+
+        self.state = {}
+        self.wideq_object = None
+
+        self.worker = None
+        self.poll_pending = False
+        self.scheduler = None
+
+        # merges quick setpoint changes, see Appliance.set_control
+        self.coalescer = wideq.ControlCoalescer(send=self.send_controls)
+
+        # optional MQTT status pushes, see start_push_feed
+        self.push_feed = None
+        self.push_pending = False
+
+    def onStart(self):
+        # these variables definitions has to be here (onStart)
+        self.DEVICE_TYPE = Parameters["Mode1"]
+        self.DEVICE_ID = Parameters["Mode2"].strip()
+        self.COUNTRY = Parameters["Mode3"]
+        self.LANGUAGE = Parameters["Mode4"]
+        self.DEBUG = Parameters["Mode6"]
+
+        if self.DEBUG == "Debug":
+            Domoticz.Debugging(1)
+
+        self.scheduler = PollScheduler.from_parameter(Parameters["Mode5"])
+        Domoticz.Heartbeat(min(self.scheduler.fast, 10))
+
+        self.multi_device = self.DEVICE_ID.lower() in ("", "all")
+
+        self.wideq_object = WideQ(country=self.COUNTRY,
+                                  language=self.LANGUAGE)
+
+        if self.wideq_object.state_file == "":
+            return False
+
+        # import web_pdb; web_pdb.set_trace()
+
+        try:
+            # read AC parameters and Client state
+            self.connect()
+
+        except UserWarning:
+            Domoticz.Error("Device not found on your LG account. Check your device ID.")
+
+        if len(self.appliances) == 0:
+            return False
+
+        self.worker = DeviceWorker(self)
+        self.worker.start()
+
+        self.start_push_feed()
+
+        for appliance in self.appliances.values():
+            appliance.create_devices()
+
+        DumpConfigToLog()
+
+    def connect(self):
+        """Create the LG devices. Keeps every device on the same Domoticz units."""
+        if self.multi_device:
+            lg_devices = self.wideq_object.operate_devices()
+        else:
+            lg_device = self.wideq_object.operate_device(device_id=self.DEVICE_ID)
+            lg_devices = [] if lg_device is None else [lg_device]
+
+        for lg_device in lg_devices:
+            device_id = lg_device.device.id
+            if self.multi_device:
+                base = self.unit_base(device_id)
+                if base is None:
+                    Domoticz.Error("No free Domoticz units left for device " + device_id)
+                    continue
+                self.appliances[device_id] = Appliance(self, lg_device, detect_device_type(lg_device), base)
+            else:
+                self.appliances[device_id] = Appliance(self, lg_device, self.DEVICE_TYPE)
+
+
+    def start_push_feed(self):
+        """Get status pushes from LG's MQTT broker. Needs paho-mqtt and cryptography packages, polling works without them."""
+        client = next(iter(self.appliances.values())).lg_device.client
+        try:
+            # reuse the broker registration saved next to the state file instead of registering on every start
+            self.push_feed = wideq.MQTTFeed.for_state_file(client, self.wideq_object.state_file)
+            self.push_feed.start()
+        except ImportError:
+            self.push_feed = None
+            Domoticz.Debug("paho-mqtt or cryptography not installed, statuses are polled only.")
+            return
+        except Exception as e:
+            self.push_feed = None
+            Domoticz.Log("Status pushes not available, statuses are polled only: " + repr(e))
+            return
+        self.watch_pushes()
+
+    def watch_pushes(self):
+        for appliance in self.appliances.values():
+            appliance.lg_device.subscribe(self.on_push)
+
+    def on_push(self, changes):
+        """Subscription callback. Polls on the worker thread are handled by process_results already."""
+        if threading.current_thread() is not self.worker:
+            self.push_pending = True
+
+    def unit_base(self, device_id):
+        """Find the units of an LG device: the slot it used before, otherwise the first free one."""
+        used = set()
+        for unit in Devices:
+            slot = (unit - 1) // UNITS_PER_DEVICE
+            if Devices[unit].DeviceID == device_id:
+                return slot * UNITS_PER_DEVICE
+            used.add(slot)
+        used.update(appliance.base // UNITS_PER_DEVICE for appliance in self.appliances.values())
+
+        slot = 0
+        while slot in used:
+            slot += 1
+        if (slot + 1) * UNITS_PER_DEVICE > MAX_UNIT:
+            return None
+        return slot * UNITS_PER_DEVICE
+
+    def onStop(self):
+        Domoticz.Log("onStop called")
+        if self.push_feed is not None:
+            self.push_feed.stop()
+        self.coalescer.close()
+        if self.wideq_object is not None:
+            self.wideq_object.stop_token_refresher()
+        if self.worker is not None:
+            self.worker.stop()
+        # no write confirmations or other LG API calls after the plugin stopped
+        for client in {appliance.lg_device.client for appliance in self.appliances.values()}:
+            client.close()
+        # the token refreshes and the login went through wideq's shared connections
+        wideq.close_transport()
+
+    def onConnect(self, Connection, Status, Description):
+        pass
+
+    def onMessage(self, Connection, Data):
+        # Domoticz.Log("onMessage called with: "+Data["Verb"])
+        # DumpDictionaryToLog(Data)
+        
+        pass
+            
+    def onCommand(self, Unit, Command, Level, Hue):
+        # Domoticz.Debug("Command received U="+str(Unit)+" C="+str(Command)+" L= "+str(Level)+" H= "+str(Hue))
+        for appliance in self.appliances.values():
+            if appliance.base < Unit <= appliance.base + UNITS_PER_DEVICE:
+                appliance.on_command(Unit - appliance.base, Command, Level)
+                self.scheduler.command_sent()
+                break
+        
+    def onDisconnect(self, Connection):
+        Domoticz.Log("onDisconnect called")
+
+    # every 10 seconds (or faster, see PollScheduler)
+    def onHeartbeat(self):
+        self.process_results()
+
+        # to check if LG devices have been already read out from server
+        # a pushed change is picked up right away, the poll is then served from the snapshot cache
+        if len(self.appliances) > 0 and not self.poll_pending and (self.push_pending or self.scheduler.due()):
+            self.poll_pending = True
+            self.push_pending = False
+            self.worker.poll()
+
+    def send_command(self, device_id, name, *args):
+        """Queue a call of an LG device's `name` method on the worker."""
+        if self.worker is not None:
+            self.worker.command(device_id, name, *args)
+
+    def send_controls(self, lg_device, values, command, ctrlKey):
+        """Coalescer callback: send the merged control values on the worker."""
+        self.send_command(lg_device.device.id, "set_controls", values, command, ctrlKey, True)
+
+    # expired access tokens are refreshed and the request replayed by wideq's Session,
+    # the LG devices, model info and snapshot caches stay as they are
+    def fetch_statuses(self):
+        """Read the status of all devices with one request. Runs on the worker thread."""
+        appliances = list(self.appliances.values())
+        if len(appliances) > 1 and not appliances[0].lg_device.client.push_connected:
+            # one dashboard download feeds every device
+            appliances[0].lg_device.client.refresh_snapshots()
+        statuses = {}
+        for appliance in appliances:
+            # devices whose snapshot did not change are neither decoded nor updated
+            status, changes = appliance.lg_device.get_status_changes()
+            if status is not None:
+                Domoticz.Debug(appliance.device_id + " changed: " + ", ".join(sorted(changes)))
+                statuses[appliance.device_id] = status
+        return statuses
+
+    def run_command(self, device_id, name, *args):
+        """Call one of an LG device's `set_*` methods. Runs on the worker thread."""
+        getattr(self.appliances[device_id].lg_device, name)(*args)
+
+    def process_results(self):
+        """Apply everything the worker has finished since the last heartbeat."""
+        if self.worker is None:
+            return
+
+        while True:
+            try:
+                kind, result = self.worker.results.get_nowait()
+            except queue.Empty:
+                break
+
+            if kind == "status":
+                self.poll_pending = False
+                changed = False
+                for device_id, status in result.items():
+                    changed = self.appliances[device_id].apply_status(status) or changed
+                running = any(appliance.operation == 1 for appliance in self.appliances.values())
+                self.scheduler.polled(changed, running)
+            elif kind == "poll_error":
+                self.poll_pending = False
+                self.scheduler.polled()
+                if isinstance(result, wideq.CircuitOpenError):
+                    # LG servers are down, polls fail fast until they are retried
+                    Domoticz.Log("LG servers unavailable, retrying in " + str(round(result.retry_in)) + " s")
+                else:
+                    Domoticz.Error("Getting LG device status failed: " + repr(result))
+            elif kind == "command_error":
+                device_id, exc = result
+                Domoticz.Error("Sending command to LG device failed: " + repr(exc))
+                # the units were updated ahead of the command, the next poll has to write the real state back
+                if device_id in self.appliances:
+                    self.appliances[device_id].lg_device.reset_changes()
+
+
+def detect_device_type(lg_device):
+    """Tell heat pumps from air conditioners by their hot water controls."""
+    if "airState.tempState.hotWaterTarget" in lg_device.model.data.get("Value", {}):
+        return "type_awhp"
+    return "type_ac"
+
+
 global _plugin
 _plugin = BasePlugin()
 
@@ -643,6 +932,75 @@ class CompatibilityError(Exception):
         self.msg = msg
 
 
+class DeviceWorker(threading.Thread):
+    """Background thread running all LG API calls (status polls and
+    commands) so Domoticz callbacks never wait on the network. Outcomes
+    are handed back through the `results` queue and applied in onHeartbeat.
+    """
+
+    def __init__(self, plugin):
+        super().__init__(name="LG ThinQ worker", daemon=True)
+        self.plugin = plugin
+        self.tasks = queue.Queue()
+        self.results = queue.Queue()
+        # deadline of the running task, cancelled if the worker does not stop in time
+        self.deadline = None
+        # set when stopping took too long, the queued tasks are then skipped
+        self.abandoned = False
+
+    def run(self):
+        while True:
+            task = self.tasks.get()
+            if task is None or self.abandoned:
+                break
+
+            kind, args = task
+            with wideq.Deadline(TASK_DEADLINE) as self.deadline:
+                self.run_task(kind, args)
+            self.deadline = None
+
+    def run_task(self, kind, args):
+        if kind == "poll":
+            try:
+                self.results.put(("status", self.plugin.fetch_statuses()))
+            except Exception as exc:
+                self.results.put(("poll_error", exc))
+        elif kind == "command":
+            try:
+                self.plugin.run_command(*args)
+            except Exception as exc:
+                self.results.put(("command_error", (args[0], exc)))
+
+    def poll(self):
+        self.tasks.put(("poll", ()))
+
+    def command(self, device_id, name, *args):
+        self.tasks.put(("command", (device_id, name) + args))
+
+    def stop(self):
+        # drop queued polls, the plugin will not apply their results anymore, but still send
+        # the queued commands (including the writes the coalescer flushed on close)
+        commands = []
+        while True:
+            try:
+                task = self.tasks.get_nowait()
+            except queue.Empty:
+                break
+            if task is not None and task[0] == "command":
+                commands.append(task)
+        for task in commands:
+            self.tasks.put(task)
+        self.tasks.put(None)
+        self.join(timeout=STOP_GRACE_TIME)
+        if self.is_alive():
+            # give up the LG API call still running, instead of retrying it after the plugin stopped
+            self.abandoned = True
+            deadline = self.deadline
+            if deadline is not None:
+                deadline.cancel()
+            self.join()
+
+
 class WideQ:
     STATE_FILE_NAME = "wideq_state.json"
     state_file: str = ""
@@ -654,6 +1012,10 @@ class WideQ:
     def __init__(self, country, language):
         self.country = country
         self.language = language
+        # Auth of the newest client, its access token is refreshed in the background
+        self.auth = None
+        # the state file is written from the worker and token refresher threads too
+        self.state_lock = threading.Lock()
 
         self.state_file = self.get_statefile_location()
         if self.state_file != "":
@@ -738,8 +1100,13 @@ class WideQ:
             raise CompatibilityError(f'Sorry, device "{device_id}" is V1 LG API and will NOT work with this domoticz plugin.')
         return device
 
-    def operate_device(self, device_id: str = ""):
+    def load_client(self):
         client = wideq.Client.load(self.state)
+        client.model_cache = wideq.ModelInfoCache.for_state_file(self.state_file)
+        # share the request rate limit with other scripts using the same state file
+        client.rate_limiter = wideq.RateLimiter.for_state_file(self.state_file)
+        # resend GETs stuck in LG's slow tail, so a poll rarely outlasts the heartbeat
+        client.transport.hedge = True
         client._country = self.country
         client._language = self.language
 
@@ -747,6 +1114,33 @@ class WideQ:
         if not client._auth:
             client._auth = self.authenticate(client.gateway)
 
+        # refresh the access token ahead of expiry instead of after a failed request
+        self.stop_token_refresher()
+        self.auth = client.auth
+        self.auth.on_refresh = lambda auth: self.save_state(client)
+        self.auth.start_refresher()
+
+        return client
+
+    def stop_token_refresher(self):
+        if self.auth is not None:
+            self.auth.stop_refresher()
+
+    def save_state(self, client):
+        current_state = client.dump()
+        current_state.pop("model_info")
+
+        # Save the updated state.
+        with self.state_lock:
+            if (self.state != current_state):
+                self.state = current_state
+                with open(self.state_file, "w") as f:
+                    json.dump(current_state, f)
+                    Domoticz.Log(f"State written to state file '{os.path.abspath(self.state_file)}'")
+
+    def operate_device(self, device_id: str = ""):
+        client = self.load_client()
+
         # Loop to retry if session has expired.
         while True:
             try:
@@ -769,14 +1163,29 @@ class WideQ:
                 Domoticz.Error("You don't have any compatible (LG API V2) devices.")
                 return None
 
-        current_state = client.dump()
-        current_state.pop("model_info")
-
-        # Save the updated state.
-        if (self.state != current_state):
-            self.state = current_state
-            with open(self.state_file, "w") as f:
-                json.dump(current_state, f)
-                Domoticz.Log(f"State written to state file '{os.path.abspath(self.state_file)}'")
+        self.save_state(client)
 
         return lg_device
+
+    def operate_devices(self):
+        """Get ACDevice objects for all thinq2 AC/AWHP devices of the account, sharing one client."""
+        client = self.load_client()
+
+        # Loop to retry if session has expired.
+        while True:
+            try:
+                lg_devices = [wideq.ACDevice(client, device)
+                              for device in client.get_devices_by_type(wideq.DeviceType.AC)
+                              if device.platform_type == "thinq2"]
+                break
+
+            except wideq.NotLoggedInError:
+                Domoticz.Log("Session expired, refreshing...")
+                client.refresh()
+
+        if len(lg_devices) == 0:
+            Domoticz.Error("You don't have any compatible (LG API V2) devices.")
+
+        self.save_state(client)
+
+        return lg_devices
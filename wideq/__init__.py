@@ -1,7 +1,12 @@
 """Reverse-engineered client for the LG SmartThinQ API.
 """
 from .core import *  # noqa
+from .cache import *  # noqa
+from .ratelimit import *  # noqa
 from .client import *  # noqa
+from .aio import *  # noqa
+from .mqtt import *  # noqa
+from .coalesce import *  # noqa
 from .ac import *  # noqa
 from .dishwasher import *  # noqa
 from .dryer import *  # noqa
@@ -237,20 +237,26 @@ class ACDevice(Device):
             f" too many reported operations: '{str(operations)}'"
         )
 
-    def set_celsius(self, c):
-        """Set the device's target temperature in Celsius degrees."""
+    def set_celsius(self, c, force=False):
+        """Set the device's target temperature in Celsius degrees.
 
-        self._set_control("airState.tempState.target", c)
+        Like all `set_*` methods, this sends nothing if the device is
+        known to have that setting already, unless `force` is set.
+        """
+
+        self._set_control("airState.tempState.target", c, force=force)
 
-    def set_fahrenheit(self, f):
+    def set_fahrenheit(self, f, force=False):
         """Set the device's target temperature in Fahrenheit degrees."""
 
-        self.set_celsius(self.f2c[f])
+        self.set_celsius(self.f2c[f], force)
 
-    def set_hot_water(self, c):
+    def set_hot_water(self, c, force=False):
         """Set the device's hot-water target temperature in Celsius degrees."""
 
-        self._set_control("airState.tempState.hotWaterTarget", c)
+        self._set_control(
+            "airState.tempState.hotWaterTarget", c, force=force
+        )
 
     def set_zones(self, zones):
         """Turn off or on the device's zones.
@@ -272,7 +278,8 @@ class ACDevice(Device):
                 for zone in zones
                 if zone["Cfg"] == "1"
             )
-            self._set_control("DuctZone", zone_cmd)
+            # Zone commands are not described in the model.
+            self._set_control("DuctZone", zone_cmd, validate=False)
 
     def get_zones(self):
         """Get the status of the zones, including whether a zone is
@@ -285,46 +292,127 @@ class ACDevice(Device):
         # don't have api data for v2 zones, not sure about format
         return []
 
-    def set_jet_mode(self, jet_opt):
+    def set_jet_mode(self, jet_opt, force=False):
         """Set jet mode to a value from the `ACJetMode` enum."""
 
         jet_opt_value = self.model.enum_value(
             "airState.wMode.jet", jet_opt.value
         )
-        self._set_control("airState.wMode.jet", jet_opt_value)
+        self._set_control("airState.wMode.jet", jet_opt_value, force=force)
 
-    def set_fan_speed(self, speed):
+    def set_fan_speed(self, speed, force=False):
         """Set the fan speed to a value from the `ACFanSpeed` enum."""
 
         speed_value = self.model.enum_value(
             "airState.windStrength", speed.value
         )
-        self._set_control("airState.windStrength", speed_value)
+        self._set_control("airState.windStrength", speed_value, force=force)
 
-    def set_horz_swing(self, swing):
+    def set_horz_swing(self, swing, force=False):
         """Set the horizontal swing to a value from the `ACHSwingMode` enum."""
 
         swing_value = self.model.enum_value("airState.wDir.hStep", swing.value)
-        self._set_control("airState.wDir.hStep", swing_value)
+        self._set_control("airState.wDir.hStep", swing_value, force=force)
 
-    def set_vert_swing(self, swing):
+    def set_vert_swing(self, swing, force=False):
         """Set the vertical swing to a value from the `ACVSwingMode` enum."""
 
         swing_value = self.model.enum_value("airState.wDir.vStep", swing.value)
-        self._set_control("airState.wDir.vStep", swing_value)
+        self._set_control("airState.wDir.vStep", swing_value, force=force)
 
-    def set_mode(self, mode):
+    def set_mode(self, mode, force=False):
         """Set the device's operating mode to an `OpMode` value."""
 
         mode_value = self.model.enum_value("airState.opMode", mode.value)
-        self._set_control("airState.opMode", mode_value)
+        self._set_control("airState.opMode", mode_value, force=force)
 
-    def set_on(self, is_on):
+    def set_on(self, is_on, force=False):
         """Turn on or off the device (according to a boolean)."""
 
         op = self.supported_on_operation if is_on else ACOp.OFF
         op_value = self.model.enum_value("airState.operation", op.value)
-        self._set_control("airState.operation", op_value, command="Operation")
+        self._set_control(
+            "airState.operation", op_value, command="Operation", force=force
+        )
+
+    def apply(
+        self,
+        on=None,
+        mode=None,
+        celsius=None,
+        fan_speed=None,
+        horz_swing=None,
+        vert_swing=None,
+        jet_mode=None,
+        force=False,
+    ):
+        """Change several settings at once, e.g. to apply a preset.
+
+        Arguments left as `None` are not changed. `mode`, `fan_speed`,
+        `horz_swing`, `vert_swing` and `jet_mode` take values of the
+        respective enums, like the `set_*` methods.
+
+        All settings except `on` are sent in one control request. The
+        power is switched with its own request, before the settings when
+        turning on and after them when turning off. If the device rejects
+        the combined request, the settings are sent one by one. Settings
+        the device is known to have already are left out unless `force`
+        is set.
+
+        All values are checked against the model first; if any is
+        invalid, `ValueError` is raised and nothing is sent.
+        """
+
+        values = {}
+        # Mode first: the temperature range and jet modes depend on it.
+        if mode is not None:
+            values["airState.opMode"] = self.model.enum_value(
+                "airState.opMode", mode.value
+            )
+        if celsius is not None:
+            values["airState.tempState.target"] = celsius
+        if fan_speed is not None:
+            values["airState.windStrength"] = self.model.enum_value(
+                "airState.windStrength", fan_speed.value
+            )
+        if horz_swing is not None:
+            values["airState.wDir.hStep"] = self.model.enum_value(
+                "airState.wDir.hStep", horz_swing.value
+            )
+        if vert_swing is not None:
+            values["airState.wDir.vStep"] = self.model.enum_value(
+                "airState.wDir.vStep", vert_swing.value
+            )
+        if jet_mode is not None:
+            values["airState.wMode.jet"] = self.model.enum_value(
+                "airState.wMode.jet", jet_mode.value
+            )
+
+        # Check everything, the power included, before sending anything,
+        # so an invalid setting does not leave the device half changed.
+        values = self._validate(values)
+        if on is not None:
+            op = self.supported_on_operation if on else ACOp.OFF
+            op_value = self.model.validate(
+                "airState.operation",
+                self.model.enum_value("airState.operation", op.value),
+            )
+
+        if on:
+            self._set_power(op_value, force)
+        if values:
+            self.set_controls(values, force=force, validate=False)
+        if on is not None and not on:
+            self._set_power(op_value, force)
+
+    def _set_power(self, op_value, force):
+        self._set_control(
+            "airState.operation",
+            op_value,
+            command="Operation",
+            force=force,
+            validate=False,
+        )
 
     def get_filter_state(self):
         """Get information about the filter."""
@@ -372,6 +460,18 @@ class ACDevice(Device):
         res = self._get_deviceinfo_from_snapshot()
         return ACStatus(self, res)
 
+    def get_status_changes(self):
+        """Get status information only if it changed since the previous
+        call.
+
+        Return a tuple of an `ACStatus` object, or `None` if nothing
+        changed, and the changed keys (see `Device.get_changes`).
+        """
+        changes = self.get_changes()
+        if not changes:
+            return None, changes
+        return ACStatus(self, self._last_snapshot), changes
+
     def poll(self):
         """Poll the device's current state.
 
@@ -0,0 +1,276 @@
+"""Asyncio counterparts of `core.Session` and `client.Client`.
+
+These need the optional `aiohttp` package. State is kept in a regular
+`Client`, so the same state files work for blocking and asyncio code.
+"""
+import asyncio
+from typing import Any, Dict, List, Optional
+from urllib.parse import urljoin
+
+from . import core
+from .client import Client, DeviceInfo, ModelInfo
+from .ratelimit import RateLimiter
+
+try:
+    import aiohttp  # type: ignore
+except ImportError:
+    aiohttp = None
+
+
+class AsyncSession(object):
+    """An asyncio version of `core.Session`.
+
+    Requests share one `aiohttp.ClientSession`, so many of them can be in
+    flight on the same event loop at once. API errors are mapped to the
+    same exceptions as in `core.thinq_request`.
+    """
+
+    def __init__(
+        self,
+        auth: core.Auth,
+        session_id=None,
+        http: Optional["aiohttp.ClientSession"] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+    ) -> None:
+        if aiohttp is None:
+            raise ImportError("AsyncSession requires the aiohttp package")
+        self.auth = auth
+        self.session_id = session_id
+        self._http = http
+        self.rate_limiter = rate_limiter
+
+    @property
+    def http(self) -> "aiohttp.ClientSession":
+        """The pooled aiohttp session, created on first use."""
+
+        if self._http is None or self._http.closed:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=core.POOL_MAX_SIZE,
+                keepalive_timeout=core.POOL_IDLE_TIMEOUT,
+            )
+            self._http = aiohttp.ClientSession(connector=connector)
+        return self._http
+
+    async def close(self) -> None:
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+
+    async def __aenter__(self) -> "AsyncSession":
+        return self
+
+    async def __aexit__(self, type, value, tb) -> None:
+        await self.close()
+
+    async def _request(self, method, url, **kwargs) -> Any:
+        """Send a request, retrying like `core.Transport.request`, and
+        return the decoded JSON body.
+
+        Only GET requests are retried after they may have been sent, on
+        `core.RETRY_STATUSES`, timeouts and dropped connections. Other
+        requests are only retried when the connection failed.
+
+        Each attempt times out like in `core.Transport.request`. For a
+        deadline spanning the retries, or to cancel a request, use
+        `asyncio.wait_for` or cancel the task.
+        """
+
+        kwargs.setdefault(
+            "timeout",
+            aiohttp.ClientTimeout(
+                sock_connect=core.CONNECT_TIMEOUT,
+                sock_read=core.READ_TIMEOUT_MAX,
+            ),
+        )
+        idempotent = method.upper() == "GET"
+        for attempt in range(core.RETRY_COUNT + 1):
+            try:
+                async with self.http.request(method, url, **kwargs) as res:
+                    if (
+                        res.status not in core.RETRY_STATUSES
+                        or not idempotent
+                        or attempt == core.RETRY_COUNT
+                    ):
+                        return await res.json(content_type=None)
+            except aiohttp.ClientConnectorError:
+                # Nothing was sent, so any request can be retried.
+                if attempt == core.RETRY_COUNT:
+                    raise
+            except aiohttp.ClientConnectionError:
+                # The request may have reached the server already.
+                if not idempotent or attempt == core.RETRY_COUNT:
+                    raise
+            await asyncio.sleep(core.RETRY_FACTOR * (2 ** attempt))
+
+    async def thinq_request(self, method, path, data=None):
+        """Make an authenticated request to the API server.
+
+        Expired access tokens are refreshed in place and the request
+        retried once, like in `core.Session`. The refresh itself is
+        blocking and runs in the default executor.
+        """
+
+        loop = asyncio.get_running_loop()
+        auth = self.auth
+        if auth.expires_at is not None and auth.expires_soon:
+            await loop.run_in_executor(None, auth.ensure_fresh)
+        token = auth.access_token
+        try:
+            return await self._send(method, path, data, token)
+        except core.NotLoggedInError:
+            await loop.run_in_executor(None, auth.refresh_in_place, token)
+            return await self._send(method, path, data, auth.access_token)
+
+    async def _send(self, method, path, data, access_token):
+        url = urljoin(self.auth.gateway.api_root + "/", path)
+        if self.rate_limiter is not None:
+            loop = asyncio.get_running_loop()
+            wait = await loop.run_in_executor(
+                None, self.rate_limiter.reserve, self.auth.user_number, url
+            )
+            await asyncio.sleep(wait)
+        headers = core.thinq_headers(
+            access_token=access_token,
+            user_number=self.auth.user_number,
+            country=self.auth.gateway.country,
+            language=self.auth.gateway.language,
+        )
+        if method == core.RequestMethod.POST:
+            out = await self._request("POST", url, json=data, headers=headers)
+        elif method == core.RequestMethod.GET:
+            out = await self._request("GET", url, headers=headers)
+        else:
+            raise ValueError("Unsupported request method")
+        return core.thinq_result(out)
+
+    async def post(self, path, data=None):
+        """Make a POST request to the API server."""
+
+        return await self.thinq_request(core.RequestMethod.POST, path, data)
+
+    async def get(self, path):
+        """Make a GET request to the API server."""
+
+        return await self.thinq_request(core.RequestMethod.GET, path)
+
+    async def get_devices(self) -> List[Dict[str, Any]]:
+        """Get a list of devices associated with the user's account."""
+
+        return core.get_list(
+            await self.get("service/application/dashboard"), "item"
+        )
+
+    async def get_device(self, device_id) -> Dict[str, Any]:
+        """Get information about a single device, including its current
+        status snapshot.
+        """
+
+        return await self.get("service/devices/{}".format(device_id))
+
+    async def device_control(self, device_id, data):
+        """Control a device's settings."""
+
+        controlPath = "service/devices/{}/control-sync".format(device_id)
+        return await self.post(controlPath, data)
+
+    async def get_energy_history(
+        self, device_id, type="hour", start_date="", end_date=""
+    ):
+        """Gets energy consumption dict.
+        type can be hour, day, month.
+        """
+
+        return await self.get(
+            core.energy_history_path(device_id, type, start_date, end_date)
+        )
+
+    async def get_model_info(self, url) -> Dict[str, Any]:
+        """Load the JSON data describing a model's capabilities."""
+
+        return await self._request("GET", url, ssl=False)
+
+
+class AsyncClient(object):
+    """An asyncio version of `client.Client`.
+
+    The gateway, authentication and cached model info live in the wrapped
+    `Client`, which also handles (de)serialization of the state.
+    """
+
+    def __init__(self, client: Optional[Client] = None) -> None:
+        self.client = client or Client()
+        self._session: Optional[AsyncSession] = None
+
+    @classmethod
+    def load(cls, state: Dict[str, Any]) -> "AsyncClient":
+        """Load a client from serialized state."""
+
+        return cls(Client.load(state))
+
+    def dump(self) -> Dict[str, Any]:
+        """Serialize the client state."""
+
+        return self.client.dump()
+
+    @property
+    def session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = AsyncSession(
+                self.client.auth, rate_limiter=self.client.rate_limiter
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+    async def __aenter__(self) -> "AsyncClient":
+        return self
+
+    async def __aexit__(self, type, value, tb) -> None:
+        await self.close()
+
+    async def get_devices(self) -> List[DeviceInfo]:
+        """Fetch DeviceInfo objects describing the user's devices."""
+
+        self.client._devices = await self.session.get_devices()
+        if not self.client._devices:
+            return []
+        return list(self.client.devices)
+
+    async def get_device(self, device_id) -> Optional[DeviceInfo]:
+        """Look up a DeviceInfo object by device ID.
+
+        Return None if the device does not exist.
+        """
+
+        if not self.client._devices and not await self.get_devices():
+            return None
+        return self.client.get_device(device_id)
+
+    async def model_info(self, device: DeviceInfo) -> ModelInfo:
+        """For a DeviceInfo object, get a ModelInfo object describing
+        the model's capabilities.
+        """
+
+        url = device.model_info_url
+        if self.client.model_cache is not None:
+            # The disk cache is blocking; keep it off the event loop.
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                None, self.client.model_info, device
+            )
+        if url not in self.client._model_info:
+            self.client._model_info[url] = await self.session.get_model_info(
+                url
+            )
+        return self.client.model_info(device)
+
+    async def refresh(self) -> None:
+        """Refresh the access token without blocking the event loop.
+
+        Like `Client.refresh`, this keeps the session and caches.
+        """
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.client.refresh)
@@ -0,0 +1,122 @@
+"""A persistent on-disk cache for model info JSON.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Any, Dict, Optional
+
+import requests
+
+from . import core
+
+#: The directory name used next to a state file, see `for_state_file`.
+CACHE_DIR_NAME = "wideq_model_cache"
+#: How long (in seconds) a cached entry is trusted before it is revalidated.
+REVALIDATE_INTERVAL = 7 * 24 * 60 * 60
+
+LOGGER = logging.getLogger("wideq.cache")
+
+
+class ModelInfoCache(object):
+    """Model info JSON stored on disk, keyed by its `modelJsonUri`.
+
+    Each URL is stored in its own file named after the URL's SHA-256
+    hash. Entries older than `revalidate_interval` seconds are checked
+    with a conditional request (ETag / Last-Modified), so unchanged models
+    are never downloaded again. If the server cannot be reached, a stale
+    entry is used rather than failing.
+    """
+
+    def __init__(
+        self, directory: str, revalidate_interval: float = REVALIDATE_INTERVAL
+    ) -> None:
+        self.directory = directory
+        self.revalidate_interval = revalidate_interval
+
+    @classmethod
+    def for_state_file(cls, state_file: str) -> "ModelInfoCache":
+        """Get the cache kept next to a `wideq_state.json` file."""
+
+        directory = os.path.dirname(os.path.abspath(state_file))
+        return cls(os.path.join(directory, CACHE_DIR_NAME))
+
+    def _path(self, url: str) -> str:
+        name = hashlib.sha256(url.encode("utf8")).hexdigest()
+        return os.path.join(self.directory, name + ".json")
+
+    def _read(self, url: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(url)) as f:
+                entry = json.load(f)
+        except (IOError, ValueError):
+            return None
+        if entry.get("url") != url:
+            return None
+        return entry
+
+    def _write(self, url: str, entry: Dict[str, Any]) -> None:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(entry, f)
+            os.replace(tmp, self._path(url))
+        except (IOError, OSError) as exc:
+            LOGGER.warning("Could not write model info cache: %s", exc)
+
+    def get(
+        self, url: str, transport: Optional[core.Transport] = None
+    ) -> Dict[str, Any]:
+        """Get the model info JSON for `url`, downloading or revalidating
+        it only when necessary.
+        """
+
+        entry = self._read(url)
+        now = time.time()
+        if entry and now - entry["checked"] < self.revalidate_interval:
+            return entry["data"]
+
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        try:
+            res = (transport or core.TRANSPORT).request(
+                "GET", url, headers=headers, verify=False
+            )
+            if res.status_code == 304 and entry:
+                LOGGER.debug("Model info not modified: %s", url)
+                entry["checked"] = now
+                self._write(url, entry)
+                return entry["data"]
+            # Never cache an error page as the model info.
+            res.raise_for_status()
+            data = res.json()
+        except (
+            requests.RequestException,
+            core.CircuitOpenError,
+            core.DeadlineExceededError,
+            core.RequestCancelledError,
+            ValueError,
+        ):
+            if entry:
+                LOGGER.warning("Using stale model info for %s", url)
+                return entry["data"]
+            raise
+
+        self._write(
+            url,
+            {
+                "url": url,
+                "etag": res.headers.get("ETag"),
+                "last_modified": res.headers.get("Last-Modified"),
+                "checked": now,
+                "data": data,
+            },
+        )
+        return data
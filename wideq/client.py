@@ -5,19 +5,84 @@ from io import UnsupportedOperation
 import json
 import enum
 import logging
-import requests
 import base64
+import queue
 import re
+import threading
+import time
 from collections import namedtuple
-from typing import Any, Dict, Generator, List, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
 
 from . import core
+from .cache import ModelInfoCache
+from .ratelimit import RateLimiter
 
 
 #: Represents an unknown enum value.
 _UNKNOWN = "Unknown"
+#: Marks a snapshot value that is not known.
+_MISSING = object()
 LOGGER = logging.getLogger("wideq.client")
 
+#: How long (in seconds) a dashboard snapshot is served from the cache.
+DEFAULT_SNAPSHOT_TTL = 10.0
+#: How long snapshots are trusted while a push feed keeps them up to date.
+PUSH_SNAPSHOT_TTL = 300.0
+#: Seconds after a control request before its effect is checked.
+WRITE_CONFIRM_DELAY = 5.0
+#: Seconds after which an unconfirmed control value is rolled back.
+WRITE_CONFIRM_TIMEOUT = 30.0
+#: How old (in seconds) a snapshot may be to skip writes that would not
+#: change it.
+DEFAULT_STATE_MAX_AGE = 120.0
+
+#: The old and new value of a snapshot key that changed. A key missing on
+#: either side is reported as None.
+Change = namedtuple("Change", ["old", "new"])
+
+
+def snapshot_value(value: Any, previous: Any) -> Any:
+    """Convert a control value to the type its snapshot key uses, e.g.
+    the enum value ``"1"`` to ``1``.
+    """
+
+    if (
+        isinstance(value, str)
+        and isinstance(previous, (int, float))
+        and not isinstance(previous, bool)
+    ):
+        try:
+            number = float(value)
+        except ValueError:
+            return value
+        if isinstance(previous, int) and number.is_integer():
+            return int(number)
+        return number
+    return value
+
+
+def diff_snapshots(
+    old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]
+) -> Dict[str, Change]:
+    """Compare two status snapshots of a device.
+
+    :returns: A mapping of every key whose value differs to a `Change`.
+        Empty if the snapshots are equal.
+    """
+
+    if old is new:
+        return {}
+    old = old or {}
+    new = new or {}
+    changes = {
+        key: Change(old.get(key), value)
+        for key, value in new.items()
+        if key not in old or old[key] != value
+    }
+    for key in old.keys() - new.keys():
+        changes[key] = Change(old[key], None)
+    return changes
+
 
 class Monitor(object):
     """A monitoring task for a device.
@@ -27,9 +92,15 @@ class Monitor(object):
     makes one `Monitor` object suitable for long-term monitoring.
     """
 
-    def __init__(self, session: core.Session, device_id: str) -> None:
+    def __init__(
+        self,
+        session: core.Session,
+        device_id: str,
+        client: Optional["Client"] = None,
+    ) -> None:
         self.session = session
         self.device_id = device_id
+        self.client = client
 
     def start(self) -> None:
         """Nothing to do for v2"""
@@ -47,6 +118,10 @@ class Monitor(object):
         # in v2, the data is available only in the snapshot,
         # getting better info without querying all devices seems to require
         # mqtt
+        if self.client is not None:
+            return self.client.snapshot(self.device_id)
+
+        pollDevice = None
         devices = self.session.get_devices()
         for device in (DeviceInfo(d) for d in devices):
             if device.id == self.device_id:
@@ -77,6 +152,80 @@ class Monitor(object):
         self.stop()
 
 
+class Subscription(object):
+    """A registration for status changes of one device, see
+    `Client.subscribe`.
+
+    With a `callback`, every change set is passed to it on the thread that
+    fetched the snapshot. Without one, change sets are queued and can be
+    consumed by iterating over the subscription, which blocks until the
+    next change arrives. Either way, only keys in `keys` are reported if
+    it is given.
+    """
+
+    def __init__(
+        self,
+        client: "Client",
+        device_id: str,
+        callback: Optional[Callable[[Dict[str, Change]], None]] = None,
+        keys: Optional[Iterable[str]] = None,
+    ) -> None:
+        self.client = client
+        self.device_id = device_id
+        self.callback = callback
+        self.keys = None if keys is None else frozenset(keys)
+        self.active = True
+        self._queue: "queue.Queue[Optional[Dict[str, Change]]]" = (
+            queue.Queue()
+        )
+
+    def _deliver(self, changes: Dict[str, Change]) -> None:
+        if self.keys is not None:
+            changes = {k: c for k, c in changes.items() if k in self.keys}
+        if not changes or not self.active:
+            return
+        if self.callback is None:
+            self._queue.put(changes)
+            return
+        try:
+            self.callback(changes)
+        except Exception:
+            LOGGER.exception("Status change callback failed")
+
+    def get(
+        self, timeout: Optional[float] = None
+    ) -> Optional[Dict[str, Change]]:
+        """Wait for the next change set.
+
+        Return None if `timeout` expires or the subscription is cancelled.
+        """
+
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def __iter__(self) -> Iterator[Dict[str, Change]]:
+        while self.active:
+            changes = self._queue.get()
+            if changes is None:
+                return
+            yield changes
+
+    def cancel(self) -> None:
+        """Stop receiving changes and end any iteration."""
+
+        self.client._unsubscribe(self)
+        self.active = False
+        self._queue.put(None)
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, type, value, tb) -> None:
+        self.cancel()
+
+
 class Client(object):
     """A higher-level API wrapper that provides a session more easily
     and allows serialization of state.
@@ -89,20 +238,92 @@ class Client(object):
         session: Optional[core.Session] = None,
         country: str = core.DEFAULT_COUNTRY,
         language: str = core.DEFAULT_LANGUAGE,
+        snapshot_ttl: float = DEFAULT_SNAPSHOT_TTL,
+        model_cache: Optional[ModelInfoCache] = None,
+        state_max_age: float = DEFAULT_STATE_MAX_AGE,
+        rate_limiter: Optional[RateLimiter] = None,
     ) -> None:
         # The three steps required to get access to call the API.
         self._gateway: Optional[core.Gateway] = gateway
         self._auth: Optional[core.Auth] = auth
         self._session: Optional[core.Session] = session
 
+        # The connection pool for this client's API requests. Each client
+        # has its own, so its pool size and hedging are not shared.
+        self.transport: core.Transport = (
+            session.transport if session else core.Transport()
+        )
+
         # The last list of devices we got from the server. This is the
         # raw JSON list data describing the devices.
         self._devices: List[Dict[str, Any]] = []
 
+        # `DeviceInfo` objects for `_devices`, indexed by device ID, type
+        # and platform. Rebuilt only when the set of devices changes.
+        self._device_index: Dict[str, DeviceInfo] = {}
+        self._devices_by_type: Dict[DeviceType, List[DeviceInfo]] = {}
+        self._devices_by_platform: Dict[str, List[DeviceInfo]] = {}
+        self._indexed_devices: Optional[List[Dict[str, Any]]] = None
+
+        # Device status snapshots, keyed by device ID. They are shared by
+        # all `Device` objects of this client and refetched once they are
+        # older than `snapshot_ttl` seconds.
+        self.snapshot_ttl: float = snapshot_ttl
+        self.state_max_age: float = state_max_age
+        self._snapshots: Dict[str, Dict[str, Any]] = {}
+        self._snapshot_times: Dict[str, float] = {}
+        self._snapshots_lock = threading.Lock()
+
+        # Held while fetching snapshots, so concurrent readers share one
+        # request. `_snapshots_lock` is only taken to read or update the
+        # dicts, never across a request, so cached reads never wait for
+        # the network. Always taken before `_snapshots_lock`.
+        self._fetch_lock = threading.Lock()
+        # When the dashboard was last fetched, as `time.monotonic()`.
+        self._dashboard_fetched = 0.0
+
+        # When each device's snapshot was last asked for. Used to choose
+        # between a single-device fetch and the whole dashboard.
+        self._snapshot_requests: Dict[str, float] = {}
+        self._device_endpoint = True
+
+        # Status change subscriptions, keyed by device ID, and the changes
+        # still to be delivered once `_snapshots_lock` is released.
+        self._subscriptions: Dict[str, List[Subscription]] = {}
+        self._pending_changes: List[Any] = []
+
+        # The optional background thread feeding the subscriptions.
+        self._poller: Optional[threading.Thread] = None
+        self._poller_stop = threading.Event()
+
+        # Set by a push feed (see `wideq.mqtt`) while it is connected.
+        # Snapshots then stay fresh for `PUSH_SNAPSHOT_TTL` and polling
+        # only resynchronizes now and then.
+        self.push_connected = False
+
+        # Control values written but not yet seen in a fetched snapshot,
+        # keyed by device ID and then by snapshot key. Each entry holds
+        # the written value, the value before and a deadline.
+        self._pending_writes: Dict[str, Dict[str, Any]] = {}
+        self._confirm_timers: Dict[str, threading.Timer] = {}
+        self._closed = False
+        # Cancelled by `close`, so background fetches give up right away.
+        self._background = core.Deadline()
+
         # Cached model info data. This is a mapping from URLs to JSON
         # responses.
         self._model_info: Dict[str, Any] = {}
 
+        # Compiled `ModelInfo` objects for the data above.
+        self._models: Dict[str, ModelInfo] = {}
+
+        # Optional on-disk cache consulted before downloading model info.
+        self.model_cache: Optional[ModelInfoCache] = model_cache
+
+        # Optional limiter for the session's API requests, which can be
+        # shared with other processes using the same account.
+        self._rate_limiter: Optional[RateLimiter] = rate_limiter
+
         # Locale information used to discover a gateway, if necessary.
         self._country: str = country
         self._language: str = language
@@ -124,16 +345,508 @@ class Client(object):
     @property
     def session(self) -> core.Session:
         if not self._session:
-            self._session, self._devices = self.auth.start_session()
+            self._session, self._devices = self.auth.start_session(
+                self.transport
+            )
+            self._session.rate_limiter = self._rate_limiter
         return self._session
 
     @property
-    def devices(self) -> Generator["DeviceInfo", None, None]:
+    def rate_limiter(self) -> Optional[RateLimiter]:
+        return self._rate_limiter
+
+    @rate_limiter.setter
+    def rate_limiter(self, rate_limiter: Optional[RateLimiter]) -> None:
+        self._rate_limiter = rate_limiter
+        if self._session:
+            self._session.rate_limiter = rate_limiter
+
+    @property
+    def devices(self) -> Iterable["DeviceInfo"]:
         """DeviceInfo objects describing the user's devices."""
 
+        self._index_devices()
+        return self._device_index.values()
+
+    def _index_devices(self) -> None:
+        """Bring the device index up to date with `_devices`, loading
+        the device list first if necessary.
+
+        When the server returns the same devices as before, the existing
+        `DeviceInfo` objects are kept and only their data is replaced.
+        """
+
         if not self._devices:
-            self._devices = self.session.get_devices()
-        return (DeviceInfo(d) for d in self._devices)
+            self.refresh_snapshots()
+        devices = self._devices
+        if devices is self._indexed_devices:
+            return
+        self._indexed_devices = devices
+
+        index = self._device_index
+        if len(devices) == len(index) and all(
+            d["deviceId"] in index for d in devices
+        ):
+            for d in devices:
+                index[d["deviceId"]].data = d
+            return
+
+        self._device_index = {}
+        self._devices_by_type = {}
+        self._devices_by_platform = {}
+        for d in devices:
+            info = index.get(d["deviceId"])
+            if info is None:
+                info = DeviceInfo(d)
+            else:
+                info.data = d
+            self._device_index[info.id] = info
+            try:
+                device_type = info.type
+            except (KeyError, ValueError):
+                LOGGER.debug("Unknown deviceType %s", d.get("deviceType"))
+            else:
+                self._devices_by_type.setdefault(device_type, []).append(info)
+            self._devices_by_platform.setdefault(
+                d.get("platformType"), []
+            ).append(info)
+
+    def refresh_snapshots(self) -> Dict[str, Dict[str, Any]]:
+        """Fetch the dashboard and update the cached snapshots of all
+        devices on the account.
+
+        While the API's circuit is open (see `core.CircuitBreaker`), the
+        last known snapshots are returned instead, if there are any.
+        """
+
+        asked = time.monotonic()
+        try:
+            with self._fetch_lock:
+                if self._dashboard_fetched > asked:
+                    # Fetched by another caller while we waited.
+                    return self._snapshots
+                try:
+                    return self._refresh_snapshots()
+                except core.CircuitOpenError:
+                    if not self._snapshots:
+                        raise
+                    LOGGER.debug("LG API unavailable, using last snapshots")
+                    return self._snapshots
+        finally:
+            self._notify()
+
+    def _refresh_snapshots(self) -> Dict[str, Dict[str, Any]]:
+        devices = self.session.get_devices()
+        self.session.transport.resize(len(devices))
+        with self._snapshots_lock:
+            self._devices = devices
+            for d in devices:
+                self._store_snapshot(d["deviceId"], d.get("snapshot"))
+            self._dashboard_fetched = time.monotonic()
+            return self._snapshots
+
+    def refresh_snapshot(self, device_id: str) -> Dict[str, Any]:
+        """Fetch and cache the snapshot of a single device."""
+
+        try:
+            with self._fetch_lock:
+                return self._refresh_snapshot(device_id)
+        finally:
+            self._notify()
+
+    def _refresh_snapshot(self, device_id: str) -> Dict[str, Any]:
+        data = self.session.get_device(device_id)
+        snapshot = data.get("snapshot") if isinstance(data, dict) else None
+        if not isinstance(snapshot, dict):
+            raise core.MalformedResponseError(data)
+        with self._snapshots_lock:
+            self._store_snapshot(device_id, snapshot)
+            return self._snapshots[device_id]
+
+    def _store_snapshot(self, device_id: str, snapshot: Dict[str, Any]):
+        previous = self._snapshots.get(device_id)
+        if device_id in self._pending_writes and snapshot is not None:
+            snapshot = self._apply_pending_writes(device_id, snapshot)
+        self._snapshots[device_id] = snapshot
+        self._snapshot_times[device_id] = time.monotonic()
+        self._queue_changes(device_id, previous, snapshot)
+
+    def _queue_changes(
+        self,
+        device_id: str,
+        old: Optional[Dict[str, Any]],
+        new: Optional[Dict[str, Any]],
+    ) -> None:
+        if device_id in self._subscriptions:
+            changes = diff_snapshots(old, new)
+            if changes:
+                self._pending_changes.append((device_id, changes))
+
+    def _notify(self) -> None:
+        """Deliver the changes found by `_store_snapshot`. Called without
+        holding `_snapshots_lock`, so callbacks may read snapshots.
+        """
+
+        with self._snapshots_lock:
+            pending, self._pending_changes = self._pending_changes, []
+        for device_id, changes in pending:
+            for subscription in list(self._subscriptions.get(device_id, ())):
+                subscription._deliver(changes)
+
+    def known_value(self, device_id: str, key: str, default: Any = None):
+        """Get the value of `key` in the cached snapshot of a device,
+        without fetching it.
+
+        Return `default` if the snapshot is older than `state_max_age`
+        (or, with a connected push feed, `PUSH_SNAPSHOT_TTL`) or has no
+        such key.
+        """
+
+        with self._snapshots_lock:
+            fetched = self._snapshot_times.get(device_id)
+            max_age = self.state_max_age
+            if self.push_connected:
+                max_age = max(max_age, PUSH_SNAPSHOT_TTL)
+            if fetched is None or time.monotonic() - fetched > max_age:
+                return default
+            return (self._snapshots.get(device_id) or {}).get(key, default)
+
+    def merge_snapshot(self, device_id: str, values: Dict[str, Any]) -> None:
+        """Update the cached snapshot of a device with pushed `values`
+        and notify its subscriptions. Unknown devices are ignored.
+        """
+
+        try:
+            with self._snapshots_lock:
+                snapshot = self._snapshots.get(device_id)
+                if snapshot is None:
+                    return
+                # Snapshots handed out before must not change under their
+                # readers, so merge into a copy.
+                merged = dict(snapshot)
+                merged.update(values)
+                self._store_snapshot(device_id, merged)
+        finally:
+            self._notify()
+
+    def patch_snapshot(self, device_id: str, values: Dict[str, Any]) -> None:
+        """Optimistically apply control values written to a device.
+
+        Reads of the device's snapshot return `values` right away. A
+        targeted refresh after `WRITE_CONFIRM_DELAY` seconds checks them;
+        values the device has not taken on after `WRITE_CONFIRM_TIMEOUT`
+        seconds are rolled back to what the server reports. Keys missing
+        from the snapshot are left out, as they could not be checked.
+        """
+
+        try:
+            with self._snapshots_lock:
+                snapshot = self._snapshots.get(device_id)
+                if snapshot is None:
+                    return
+                deadline = time.monotonic() + WRITE_CONFIRM_TIMEOUT
+                pending = self._pending_writes.setdefault(device_id, {})
+                patched = dict(snapshot)
+                for key, value in values.items():
+                    if key not in snapshot and key not in pending:
+                        # The server does not report this key, so the
+                        # write could never be confirmed.
+                        continue
+                    previous = snapshot.get(key)
+                    if key in pending:
+                        previous = pending[key][1]
+                    value = snapshot_value(value, previous)
+                    pending[key] = (value, previous, deadline)
+                    patched[key] = value
+                if not pending:
+                    del self._pending_writes[device_id]
+                    return
+                self._snapshots[device_id] = patched
+                self._queue_changes(device_id, snapshot, patched)
+                self._schedule_confirm(device_id)
+        finally:
+            self._notify()
+
+    def rollback_snapshot(self, device_id: str, keys: Iterable[str]) -> None:
+        """Undo `patch_snapshot` for `keys`, e.g. because the control
+        request failed.
+        """
+
+        try:
+            with self._snapshots_lock:
+                self._rollback(device_id, keys)
+        finally:
+            self._notify()
+
+    def _rollback(self, device_id: str, keys: Iterable[str]) -> None:
+        pending = self._pending_writes.get(device_id, {})
+        snapshot = self._snapshots.get(device_id)
+        restored = dict(snapshot or {})
+        for key in keys:
+            if key not in pending:
+                continue
+            value, previous, _ = pending.pop(key)
+            # Leave values fetched since the patch alone.
+            if restored.get(key) == value:
+                restored[key] = previous
+        if not pending:
+            self._pending_writes.pop(device_id, None)
+        if snapshot is not None:
+            self._snapshots[device_id] = restored
+            self._queue_changes(device_id, snapshot, restored)
+
+    def _apply_pending_writes(
+        self, device_id: str, snapshot: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Keep written values in a fetched snapshot until the device has
+        taken them on or their deadline has passed.
+        """
+
+        pending = self._pending_writes[device_id]
+        now = time.monotonic()
+        overlay = {}
+        for key, (value, previous, deadline) in list(pending.items()):
+            if snapshot_value(snapshot.get(key), value) == value:
+                del pending[key]
+            elif now >= deadline:
+                LOGGER.debug("Rolling back %s of %s", key, device_id)
+                del pending[key]
+            else:
+                overlay[key] = value
+        if not pending:
+            del self._pending_writes[device_id]
+        if not overlay:
+            return snapshot
+        snapshot = dict(snapshot)
+        snapshot.update(overlay)
+        return snapshot
+
+    def _schedule_confirm(self, device_id: str) -> None:
+        if self._closed or device_id in self._confirm_timers:
+            return
+        timer = threading.Timer(
+            WRITE_CONFIRM_DELAY, self._confirm_writes, (device_id,)
+        )
+        timer.daemon = True
+        self._confirm_timers[device_id] = timer
+        timer.start()
+
+    def _confirm_writes(self, device_id: str) -> None:
+        """Refresh a device with pending writes, rolling back the ones
+        that could not be confirmed in time.
+        """
+
+        if self._closed:
+            return
+        try:
+            with core.Deadline(core.REQUEST_DEADLINE, self._background):
+                if self._device_endpoint:
+                    self.refresh_snapshot(device_id)
+                else:
+                    self.refresh_snapshots()
+        except Exception as exc:
+            LOGGER.debug("Could not confirm writes to %s: %s", device_id, exc)
+
+        try:
+            with self._snapshots_lock:
+                # Already gone if the client was closed meanwhile.
+                self._confirm_timers.pop(device_id, None)
+                pending = self._pending_writes.get(device_id)
+                if not pending:
+                    return
+                now = time.monotonic()
+                overdue = [k for k, p in pending.items() if now >= p[2]]
+                if overdue:
+                    # The refresh failed; the server's state is unknown.
+                    self._rollback(device_id, overdue)
+                    self._snapshot_times.pop(device_id, None)
+                if device_id in self._pending_writes:
+                    self._schedule_confirm(device_id)
+        finally:
+            self._notify()
+
+    def _is_fresh(self, device_id: str, now: float) -> bool:
+        fetched = self._snapshot_times.get(device_id)
+        ttl = self.snapshot_ttl
+        if self.push_connected:
+            ttl = max(ttl, PUSH_SNAPSHOT_TTL)
+        return fetched is not None and now - fetched <= ttl
+
+    def _wants_dashboard(self, device_id: str, now: float) -> bool:
+        """Whether fetching the whole dashboard is cheaper than fetching
+        `device_id` alone, i.e. other devices are being read as well.
+        """
+
+        if not self._device_endpoint:
+            return True
+        window = 2 * self.snapshot_ttl
+        return any(
+            other != device_id and now - requested <= window
+            for other, requested in self._snapshot_requests.items()
+        )
+
+    def snapshot(self, device_id: str) -> Dict[str, Any]:
+        """Get the status snapshot of a device.
+
+        Cached snapshots are used while they are younger than
+        `snapshot_ttl`. A stale snapshot is refetched with the per-device
+        endpoint when only this device is being read, and with the
+        dashboard when several devices are read, so one heartbeat costs a
+        single request. While the API's circuit is open, the last known
+        snapshot is returned, however old.
+
+        :raises DeviceNotFoundError: If the device is not on the account.
+        """
+
+        try:
+            with self._snapshots_lock:
+                now = time.monotonic()
+                self._snapshot_requests[device_id] = now
+                fresh = self._is_fresh(device_id, now)
+            if not fresh:
+                with self._fetch_lock:
+                    self._fetch_stale_snapshot(device_id)
+            with self._snapshots_lock:
+                if device_id not in self._snapshots:
+                    raise core.DeviceNotFoundError()
+                return self._snapshots[device_id]
+        finally:
+            self._notify()
+
+    def _fetch_stale_snapshot(self, device_id: str) -> None:
+        """Fetch a device's snapshot unless another caller has done so
+        while we waited for `_fetch_lock`.
+        """
+
+        with self._snapshots_lock:
+            now = time.monotonic()
+            if self._is_fresh(device_id, now):
+                return
+            dashboard = self._wants_dashboard(device_id, now)
+        try:
+            self._fetch_snapshot(device_id, dashboard)
+        except core.CircuitOpenError:
+            if self._snapshots.get(device_id) is None:
+                raise
+            LOGGER.debug("LG API unavailable, using last snapshot")
+
+    def _fetch_snapshot(self, device_id: str, dashboard: bool) -> None:
+        if dashboard:
+            self._refresh_snapshots()
+            return
+        try:
+            self._refresh_snapshot(device_id)
+        except (
+            core.FailedRequestError,
+            core.InvalidRequestError,
+            core.MalformedResponseError,
+        ):
+            # The server does not offer the per-device endpoint, or it
+            # has no snapshot in it. Other errors may be transient and
+            # are left to the caller.
+            LOGGER.debug("Per-device status unavailable, using dashboard")
+            self._device_endpoint = False
+            self._refresh_snapshots()
+
+    def invalidate_snapshots(self) -> None:
+        """Force the next `snapshot` call to fetch the status again."""
+
+        with self._snapshots_lock:
+            self._snapshot_times.clear()
+
+    def subscribe(
+        self,
+        device_id: str,
+        callback: Optional[Callable[[Dict[str, Change]], None]] = None,
+        keys: Optional[Iterable[str]] = None,
+    ) -> Subscription:
+        """Get notified when the status snapshot of a device changes.
+
+        Subscriptions are fed by every snapshot this client fetches, so
+        any number of them share the same requests. Use `start_polling`
+        if nothing else fetches snapshots regularly.
+        """
+
+        subscription = Subscription(self, device_id, callback, keys)
+        with self._snapshots_lock:
+            self._subscriptions.setdefault(device_id, []).append(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription) -> None:
+        with self._snapshots_lock:
+            subscriptions = self._subscriptions.get(subscription.device_id)
+            if subscriptions and subscription in subscriptions:
+                subscriptions.remove(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.device_id]
+
+    def start_polling(self, interval: Optional[float] = None) -> None:
+        """Fetch the dashboard every `interval` seconds (`snapshot_ttl`
+        by default) on a background thread, feeding all subscriptions
+        with one request.
+        """
+
+        if self._poller is not None and self._poller.is_alive():
+            return
+        interval = self.snapshot_ttl if interval is None else interval
+        self._poller_stop.clear()
+        self._poller = threading.Thread(
+            target=self._poll_loop,
+            args=(interval,),
+            name="wideq-poller",
+            daemon=True,
+        )
+        self._poller.start()
+
+    def stop_polling(self) -> None:
+        """Stop the thread started by `start_polling`."""
+
+        self._poller_stop.set()
+        if (
+            self._poller is not None
+            and self._poller is not threading.current_thread()
+        ):
+            self._poller.join()
+        self._poller = None
+
+    def close(self) -> None:
+        """Stop all background work of this client: polling and the
+        pending write confirmations. Writes not confirmed yet stay in
+        the cached snapshots as they are. The pooled connections are
+        closed too.
+        """
+
+        with self._snapshots_lock:
+            self._closed = True
+            timers = list(self._confirm_timers.values())
+            self._confirm_timers.clear()
+        self._background.cancel()
+        self.stop_polling()
+        for timer in timers:
+            timer.cancel()
+            # One may be confirming already; its fetch was cancelled.
+            if timer is not threading.current_thread():
+                timer.join(core.CLOSE_TIMEOUT)
+        self.transport.close()
+
+    def _poll_loop(self, interval: float) -> None:
+        while not self._poller_stop.is_set():
+            now = time.monotonic()
+            if self._subscriptions and not (
+                self.push_connected
+                and all(self._is_fresh(d, now) for d in self._subscriptions)
+            ):
+                deadline = core.Deadline(
+                    core.REQUEST_DEADLINE, self._background
+                )
+                try:
+                    with deadline:
+                        self.refresh_snapshots()
+                except core.RequestCancelledError:
+                    pass
+                except Exception:
+                    LOGGER.exception("Polling device status failed")
+            self._poller_stop.wait(interval)
 
     def get_device(self, device_id) -> Optional["DeviceInfo"]:
         """Look up a DeviceInfo object by device ID.
@@ -141,10 +854,28 @@ class Client(object):
         Return None if the device does not exist.
         """
 
-        for device in self.devices:
-            if device.id == device_id:
-                return device
-        return None
+        self._index_devices()
+        return self._device_index.get(device_id)
+
+    def get_devices_by_type(
+        self, device_type: "DeviceType"
+    ) -> List["DeviceInfo"]:
+        """Look up the DeviceInfo objects of all devices of a given
+        `DeviceType`.
+        """
+
+        self._index_devices()
+        return list(self._devices_by_type.get(device_type, ()))
+
+    def get_devices_by_platform(
+        self, platform_type: str
+    ) -> List["DeviceInfo"]:
+        """Look up the DeviceInfo objects of all devices on a platform,
+        such as "thinq1" or "thinq2".
+        """
+
+        self._index_devices()
+        return list(self._devices_by_platform.get(platform_type, ()))
 
     def get_device_obj(self, device_id):
         """Look up a subclass of Device object by device ID.
@@ -183,10 +914,13 @@ class Client(object):
                 data["refresh_token"],
                 data["user_number"],
                 data["oauth_root"],
+                data.get("expires_at"),
             )
 
         if "session" in state:
-            client._session = core.Session(client.auth, state["session"])
+            client._session = core.Session(
+                client.auth, state["session"], client.transport
+            )
 
         if "model_info" in state:
             client._model_info = state["model_info"]
@@ -221,8 +955,14 @@ class Client(object):
         return out
 
     def refresh(self) -> None:
-        self._auth = self.auth.refresh()
-        self._session, self._devices = self.auth.start_session()
+        """Get a new access token.
+
+        The token is replaced in place, so the session, the device list,
+        the model info and the snapshot caches are kept, as are the
+        `Device` objects using this client.
+        """
+
+        self.auth.refresh_in_place()
 
     @classmethod
     def from_token(
@@ -244,9 +984,18 @@ class Client(object):
         the model's capabilities.
         """
         url = device.model_info_url
-        if url not in self._model_info:
-            self._model_info[url] = device.load_model_info()
-        return ModelInfo(self._model_info[url])
+        if url not in self._models:
+            if url not in self._model_info:
+                if self.model_cache is not None:
+                    self._model_info[url] = self.model_cache.get(
+                        url, self.session.transport
+                    )
+                else:
+                    self._model_info[url] = device.load_model_info(
+                        self.session.transport
+                    )
+            self._models[url] = ModelInfo(self._model_info[url])
+        return self._models[url]
 
 
 class DeviceType(enum.Enum):
@@ -316,9 +1065,13 @@ class DeviceInfo(object):
 
         return DeviceType(self.data["deviceType"])
 
-    def load_model_info(self):
+    def load_model_info(self, transport: Optional[core.Transport] = None):
         """Load JSON data describing the model's capabilities."""
-        return requests.get(self.model_info_url, verify=False).json()
+        res = (transport or core.TRANSPORT).request(
+            "GET", self.model_info_url, verify=False
+        )
+        res.raise_for_status()
+        return res.json()
 
 
 BitValue = namedtuple("BitValue", ["options"])
@@ -331,10 +1084,47 @@ StringValue = namedtuple("StringValue", ["comment"])
 
 
 class ModelInfo(object):
-    """A description of a device model's capabilities."""
+    """A description of a device model's capabilities.
+
+    All `Value` entries are compiled once into their typed descriptors,
+    so decoding a status or encoding a command is a plain dict lookup.
+    """
 
     def __init__(self, data):
         self.data = data
+        self._values: Dict[str, Any] = {}
+        self._enum_values: Dict[str, Dict[str, str]] = {}
+        for name, d in data.get("Value", {}).items():
+            try:
+                value = self._compile_value(d)
+            except (AttributeError, IndexError, KeyError, TypeError):
+                value = None
+            self._values[name] = value
+            if isinstance(value, EnumValue):
+                # Invert the map for encoding friendly names.
+                self._enum_values[name] = {
+                    v: k for k, v in value.options.items()
+                }
+
+    def _compile_value(self, d: Dict[str, Any]):
+        """Build the descriptor for a raw `Value` entry, or None if its
+        type is not supported.
+        """
+        data_type = d.get("data_type", d.get("type")).lower()
+        option = d.get("option", d.get("value_validation"))
+        if data_type == "enum":
+            return EnumValue(d.get("value_mapping", d.get("option")))
+        elif data_type == "range":
+            return RangeValue(
+                option["min"], option["max"], option.get("step", 1)
+            )
+        elif data_type == "bit":
+            return BitValue({opt["startbit"]: opt["value"] for opt in option})
+        elif data_type == "reference":
+            return ReferenceValue(self.data[option[0]])
+        elif data_type == "string":
+            return StringValue(d.get("_comment", ""))
+        return None
 
     def value(self, name: str):
         """Look up information about a value.
@@ -344,30 +1134,47 @@ class ModelInfo(object):
             `ReferenceValue`, `StringValue`).
         :raises ValueError: If an unsupported type is encountered.
         """
-        d = self.data["Value"][name]
-        if d.get("data_type", d.get("type")) in ("Enum", "enum"):
-            return EnumValue(d.get("value_mapping", d.get("option")))
-        elif d.get("data_type", d.get("type")) == "Range":
-            return RangeValue(
-                d.get("option", d.get("value_validation"))["min"],
-                d.get("option", d.get("value_validation"))["max"],
-                d.get("option", d.get("value_validation")).get("step", 1),
-            )
-        elif d.get("data_type", d.get("type")).lower() == "bit":
-            bit_values = {
-                opt["startbit"]: opt["value"]
-                for opt in d.get("option", d.get("value_validation"))
-            }
-            return BitValue(bit_values)
-        elif d.get("data_type", d.get("type")).lower() == "reference":
-            ref = d.get("option", d.get("value_validation"))[0]
-            return ReferenceValue(self.data[ref])
-        elif d.get("data_type", d.get("type")).lower() == "string":
-            return StringValue(d.get("_comment", ""))
-        else:
+        value = self._values[name]
+        if value is None:
             raise ValueError(
-                f"unsupported value name: '{name}'" f"data: '{str(d)}'"
+                f"unsupported value name: '{name}'"
+                f"data: '{str(self.data['Value'][name])}'"
             )
+        return value
+
+    def validate(self, key: str, value: Any) -> Any:
+        """Check a control value against the model without asking the
+        server.
+
+        Range values are snapped to the nearest step, enum values must be
+        one of the encoded options. Other kinds of values, and values the
+        model describes in an unsupported way, are passed unchanged.
+
+        :returns: The value to send.
+        :raises ValueError: If the model has no `key` or does not allow
+            `value`.
+        """
+        if key not in self._values:
+            raise ValueError(f"unsupported control: '{key}'")
+        spec = self._values[key]
+        if isinstance(spec, RangeValue):
+            try:
+                number = float(value)
+                low, high = float(spec.min), float(spec.max)
+                step = float(spec.step) or 1.0
+            except (TypeError, ValueError):
+                raise ValueError(f"invalid value for '{key}': {value!r}")
+            if not low <= number <= high:
+                raise ValueError(
+                    f"value for '{key}' must be between {spec.min} and"
+                    f" {spec.max}: {value!r}"
+                )
+            number = min(low + round((number - low) / step) * step, high)
+            number = round(number, 6)
+            return int(number) if number.is_integer() else number
+        if isinstance(spec, EnumValue) and str(value) not in spec.options:
+            raise ValueError(f"invalid value for '{key}': {value!r}")
+        return value
 
     def default(self, name):
         """Get the default value, if it exists, for a given value."""
@@ -375,24 +1182,24 @@ class ModelInfo(object):
 
     def enum_value(self, key, name):
         """Look up the encoded value for a friendly enum name."""
-        options = self.value(key).options
-        options_inv = {v: k for k, v in options.items()}  # Invert the map.
-        return options_inv[name]
+        if key not in self._enum_values:
+            self.value(key)  # Raise the right error for non-enum keys.
+            raise KeyError(key)
+        return self._enum_values[key][name]
 
     def enum_name(self, key, value):
         """Look up the friendly enum name for an encoded value."""
         options = self.value(key).options
-        if str(int(value)) not in options:
+        encoded = str(int(value))
+        if encoded not in options:
             LOGGER.warning(
-                "Value `%s` for key `%s` not in options: %s. Values from API: "
-                "%s",
-                str(int(value)),
+                "Value `%s` for key `%s` not in options: %s.",
+                encoded,
                 key,
                 options,
-                value.get("value_mapping", value.get("option")),
             )
             return _UNKNOWN
-        return options[str(int(value))]
+        return options[encoded]
 
     def reference_name(self, key: str, value: Any) -> Optional[str]:
         """Look up the friendly name for an encoded reference value.
@@ -454,29 +1261,168 @@ class Device(object):
         self.client = client
         self.device = device
         self.model: ModelInfo = client.model_info(device)
+        self._last_snapshot: Optional[Dict[str, Any]] = None
 
     def _get_deviceinfo_from_snapshot(self):
-        # probably should cache the snapshot somehow
-        devices = self.client.session.get_devices()
-        for device in (DeviceInfo(d) for d in devices):
-            if device.id == self.device.id:
-                pollDevice = device
-        if pollDevice is None:
-            raise core.DeviceNotFoundError()
-        return pollDevice.data["snapshot"]
+        return self.client.snapshot(self.device.id)
 
-    def _set_control(self, key, value, command="Set", ctrlKey="basicCtrl"):
-        """Set a device's control for `key` to `value`."""
-        self.client.session.device_control(
-            self.device.id,
-            {
-                "ctrlKey": ctrlKey,
-                "command": command,
-                "dataKey": key,
-                "dataValue": value,
-            },
+    def subscribe(
+        self,
+        callback: Optional[Callable[[Dict[str, Change]], None]] = None,
+        keys: Optional[Iterable[str]] = None,
+    ) -> Subscription:
+        """Get notified when this device's status changes.
+
+        See `Client.subscribe`. `keys` limits the notifications to the
+        given snapshot keys, e.g. ``["airState.tempState.current"]``.
+        """
+
+        return self.client.subscribe(self.device.id, callback, keys)
+
+    def get_changes(self) -> Dict[str, Change]:
+        """Get the device's status snapshot and compare it with the one
+        seen by the previous call.
+
+        :returns: The changed keys, see `diff_snapshots`. The first call
+            reports every key as changed.
+        """
+        snapshot = self._get_deviceinfo_from_snapshot()
+        changes = diff_snapshots(self._last_snapshot, snapshot)
+        self._last_snapshot = snapshot
+        return changes
+
+    def reset_changes(self) -> None:
+        """Make the next `get_changes` report every key as changed, e.g.
+        when what was shown of the status may be wrong.
+        """
+        self._last_snapshot = None
+
+    def is_noop(self, key, value) -> bool:
+        """Whether setting control `key` to `value` would not change
+        the device's recently known state (see `Client.known_value`).
+        """
+        current = self.client.known_value(self.device.id, key, _MISSING)
+        return current is not _MISSING and (
+            snapshot_value(value, current) == current
         )
 
+    def _validate(self, values):
+        """Validate several control values, see `ModelInfo.validate`."""
+        return {k: self.model.validate(k, v) for k, v in values.items()}
+
+    def _set_control(
+        self,
+        key,
+        value,
+        command="Set",
+        ctrlKey="basicCtrl",
+        force=False,
+        validate=True,
+    ):
+        """Set a device's control for `key` to `value`.
+
+        With `validate`, the value is first checked and snapped against
+        the model (see `ModelInfo.validate`), so unsupported values raise
+        a `ValueError` without a request. Nothing is sent if the device
+        is known to be in that state already, unless `force` is set. The
+        cached snapshot is patched right away, so reads return the new
+        value before the server reports it (see `Client.patch_snapshot`).
+        """
+        if validate:
+            value = self.model.validate(key, value)
+        if not force and self.is_noop(key, value):
+            LOGGER.debug(
+                "Skipping no-op %s=%s for %s", key, value, self.device.id
+            )
+            return
+        self.client.patch_snapshot(self.device.id, {key: value})
+        try:
+            self.client.session.device_control(
+                self.device.id,
+                {
+                    "ctrlKey": ctrlKey,
+                    "command": command,
+                    "dataKey": key,
+                    "dataValue": value,
+                },
+            )
+        except Exception:
+            self.client.rollback_snapshot(self.device.id, [key])
+            raise
+
+    def set_controls(
+        self,
+        values,
+        command="Set",
+        ctrlKey="basicCtrl",
+        force=False,
+        validate=True,
+    ):
+        """Set one or more controls, using as few requests as possible.
+
+        `values` maps control keys to their (encoded) values. Several
+        keys are sent in one request; if the device rejects that, they
+        are sent one by one. Values are validated and no-ops left out
+        like in `_set_control`.
+        """
+        if validate:
+            values = self._validate(values)
+        if not force:
+            values = {
+                k: v for k, v in values.items() if not self.is_noop(k, v)
+            }
+        if not values:
+            return
+        if len(values) == 1:
+            key, value = next(iter(values.items()))
+            self._set_control(key, value, command, ctrlKey, True, False)
+            return
+        try:
+            self._set_controls(values, command, ctrlKey, True, False)
+        except (core.FailedRequestError, core.InvalidRequestError):
+            for key, value in values.items():
+                self._set_control(key, value, command, ctrlKey, True, False)
+
+    def _set_controls(
+        self,
+        values,
+        command="Set",
+        ctrlKey="basicCtrl",
+        force=False,
+        validate=True,
+    ):
+        """Set several of a device's controls with a single request.
+
+        `values` maps the keys to their new values. They are validated,
+        no-op writes are skipped and the cached snapshot is patched like
+        in `_set_control`.
+        """
+        if validate:
+            values = self._validate(values)
+        if not force:
+            values = {
+                k: v for k, v in values.items() if not self.is_noop(k, v)
+            }
+            if not values:
+                return
+        keys = list(values)
+        self.client.patch_snapshot(self.device.id, values)
+        try:
+            self.client.session.device_control(
+                self.device.id,
+                {
+                    "ctrlKey": ctrlKey,
+                    "command": command,
+                    "dataKey": None,
+                    "dataValue": None,
+                    "dataKeyList": keys,
+                    "dataValueList": [values[k] for k in keys],
+                },
+            )
+        except Exception:
+            self.client.rollback_snapshot(self.device.id, keys)
+            raise
+
     def _get_config(self, key, ctrlKey="basicCtrl"):
         """Look up a device's configuration for a given value.
 
@@ -506,7 +1452,7 @@ class Device(object):
 
     def monitor_start(self):
         """Start monitoring the device's status."""
-        mon = Monitor(self.client.session, self.device.id)
+        mon = Monitor(self.client.session, self.device.id, self.client)
         mon.start()
         self.mon = mon
 
@@ -0,0 +1,166 @@
+"""Coalescing of rapid control writes into few requests.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from .client import Device
+
+#: Seconds without a new write after which a device's writes are sent.
+COALESCE_WINDOW = 0.5
+#: Upper bound (in seconds) on how long a write may be held back.
+COALESCE_MAX_DELAY = 2.0
+
+LOGGER = logging.getLogger("wideq.coalesce")
+
+
+class _PendingWrites(object):
+    """The writes held back for one device."""
+
+    def __init__(self, device: Device, now: float) -> None:
+        self.device = device
+        self.first = now
+        self.last = now
+        # (command, ctrlKey) -> {key: value}, in the order of first use.
+        self.groups: Dict[Any, Dict[str, Any]] = {}
+
+
+class ControlCoalescer(object):
+    """A per-device, per-key queue of control writes.
+
+    Writes to the same key that arrive while earlier ones are still held
+    back replace them, so only the last value is sent. A device's writes
+    are sent once no new write has arrived for `window` seconds, but
+    never later than `max_delay` seconds after the first one. Writes to
+    different keys with the same command go out in one request.
+
+    Each write is applied to the client's cached snapshot right away, so
+    reads see it before it is sent. Writes that would not change the
+    device's known state are dropped (see `Device.is_noop`). Sending
+    happens on a background thread through `send`, which must send the
+    values as they are and defaults to `Device.set_controls`. Errors are
+    passed to `on_error`, or logged.
+    """
+
+    def __init__(
+        self,
+        window: float = COALESCE_WINDOW,
+        max_delay: float = COALESCE_MAX_DELAY,
+        send: Optional[Callable[..., None]] = None,
+        on_error: Optional[Callable[[Exception], None]] = None,
+    ) -> None:
+        self.window = window
+        self.max_delay = max_delay
+        self.send = send or self._send
+        self.on_error = on_error
+        self._pending: Dict[str, _PendingWrites] = {}
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    @staticmethod
+    def _send(device: Device, values, command, ctrlKey) -> None:
+        device.set_controls(values, command, ctrlKey, force=True)
+
+    def set(
+        self,
+        device: Device,
+        key: str,
+        value: Any,
+        command: str = "Set",
+        ctrlKey: str = "basicCtrl",
+        force: bool = False,
+    ) -> None:
+        """Queue setting `device`'s control `key` to `value`.
+
+        The value is validated right away (see `ModelInfo.validate`).
+        Nothing is queued if the device has that value already and no
+        other value for `key` is held back, unless `force` is set.
+
+        :raises ValueError: If the model does not allow the value.
+        """
+
+        value = device.model.validate(key, value)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("ControlCoalescer is closed")
+            pending = self._pending.get(device.device.id)
+            held = pending is not None and any(
+                key in values for values in pending.groups.values()
+            )
+            if not force and not held and device.is_noop(key, value):
+                return
+            device.client.patch_snapshot(device.device.id, {key: value})
+            now = time.monotonic()
+            if pending is None:
+                pending = _PendingWrites(device, now)
+                self._pending[device.device.id] = pending
+            pending.device = device
+            pending.last = now
+            pending.groups.setdefault((command, ctrlKey), {})[key] = value
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="wideq-coalescer", daemon=True
+                )
+                self._thread.start()
+            self._cond.notify()
+
+    def _due(self, pending: _PendingWrites, now: float) -> float:
+        return min(pending.last + self.window, pending.first + self.max_delay)
+
+    def _take(self, force: bool = False):
+        """Remove and return the pending writes that are due, and the
+        time until the next one is.
+        """
+
+        now = time.monotonic()
+        due = []
+        wait = None
+        for device_id, pending in list(self._pending.items()):
+            at = self._due(pending, now)
+            if force or at <= now:
+                due.append(self._pending.pop(device_id))
+            elif wait is None or at - now < wait:
+                wait = at - now
+        return due, wait
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                due, wait = self._take(self._closed)
+                while not due and not self._closed:
+                    self._cond.wait(wait)
+                    due, wait = self._take(self._closed)
+                if not due and self._closed:
+                    self._thread = None
+                    return
+            self._flush(due)
+
+    def _flush(self, due) -> None:
+        for pending in due:
+            for (command, ctrlKey), values in pending.groups.items():
+                try:
+                    self.send(pending.device, values, command, ctrlKey)
+                except Exception as exc:
+                    if self.on_error is None:
+                        LOGGER.exception("Sending coalesced writes failed")
+                    else:
+                        self.on_error(exc)
+
+    def flush(self) -> None:
+        """Send all held back writes now, on the calling thread."""
+
+        with self._cond:
+            due, _ = self._take(force=True)
+        self._flush(due)
+
+    def close(self) -> None:
+        """Send the held back writes and stop the background thread."""
+
+        with self._cond:
+            self._closed = True
+            thread = self._thread
+            self._cond.notify()
+        if thread is not None:
+            thread.join()
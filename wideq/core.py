@@ -8,15 +8,21 @@ import hashlib
 import hmac
 import datetime
 import requests
+import urllib3
 import logging
-from typing import Any, Dict, List, Tuple
-from requests.adapters import HTTPAdapter
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
+from requests.adapters import HTTPAdapter, DEFAULT_POOLSIZE
 from requests.packages.urllib3.util.retry import Retry
 from time import strftime
 
 GATEWAY_URL = (
     "https://route.lgthinq.com:46030/v1/service/application/gateway-uri"
 )
+ROUTE_URL = "https://common.lgthinq.com/route"
 SECURITY_KEY = "nuts_securitykey"
 APP_KEY = "wideq"
 DATA_ROOT = "result"
@@ -51,6 +57,51 @@ RETRY_COUNT = 5  # Anecdotally this seems sufficient.
 RETRY_FACTOR = 0.5
 RETRY_STATUSES = (502, 503, 504)
 
+# Connection pooling. One pool per host (gateway, OAuth, API root and the
+# model JSON CDN), each holding a connection per concurrently used device.
+POOL_CONNECTIONS = 8
+POOL_MIN_SIZE = 2
+POOL_MAX_SIZE = 32
+POOL_IDLE_TIMEOUT = 300  # Seconds before idle keep-alive sockets are closed.
+
+# Access token lifetime handling, in seconds.
+TOKEN_LIFETIME = 3600  # Assumed if the server does not tell.
+TOKEN_REFRESH_MARGIN = 300  # Refresh this long before the token expires.
+TOKEN_RETRY_DELAY = 60  # Wait before retrying a failed background refresh.
+
+# Timeouts, in seconds. A call, retries included, must finish within its
+# `Deadline`; each GET attempt gets a read timeout adapted to the latency
+# observed for its endpoint class.
+REQUEST_DEADLINE = 30  # Used when the caller sets no deadline.
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT_MIN = 2
+READ_TIMEOUT_MAX = 15
+READ_TIMEOUT_FACTOR = 3  # Multiple of the 95th percentile latency.
+LATENCY_SAMPLES = 50
+RECEIVE_CHUNK_SIZE = 8192  # Bytes read at a time, see `Transport._receive`.
+# How long `Transport.close` waits for abandoned attempts to give up. An
+# attempt blocks for at most a connect and a read timeout.
+CLOSE_TIMEOUT = CONNECT_TIMEOUT + READ_TIMEOUT_MAX
+
+# Failing fast during outages. After CIRCUIT_FAILURE_THRESHOLD failed
+# attempts in a row an endpoint's circuit opens; after
+# CIRCUIT_RESET_TIMEOUT seconds one trial request is let through.
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 60
+# Retries may add at most RETRY_BUDGET_RATIO to the requests made in the
+# last RETRY_BUDGET_WINDOW seconds, plus RETRY_BUDGET_MIN.
+RETRY_BUDGET_RATIO = 0.2
+RETRY_BUDGET_MIN = 3
+RETRY_BUDGET_WINDOW = 60
+
+# Hedging of GETs (see `Transport.hedge`): a second request is sent once
+# the first has taken longer than the HEDGE_PERCENTILE latency, known
+# from at least HEDGE_MIN_SAMPLES requests. Hedges may add at most
+# HEDGE_BUDGET_RATIO to the requests made.
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_BUDGET_RATIO = 0.1
+
 
 def get_wideq_logger() -> logging.Logger:
     level = logging.INFO
@@ -88,25 +139,728 @@ def get_wideq_logger() -> logging.Logger:
 
 LOGGER = get_wideq_logger()
 
+_local = threading.local()
+
+
+def current_deadline() -> Optional["Deadline"]:
+    """Get the innermost `Deadline` entered on this thread, if any."""
+
+    stack = getattr(_local, "deadlines", None)
+    return stack[-1] if stack else None
+
+
+class Deadline(object):
+    """A time budget for a call, spanning all of its retries, that can
+    also be cancelled from another thread.
+
+    Used as a context manager, the deadline applies to all requests made
+    on the current thread within the block. Nested deadlines can only
+    shorten the outer one, and cancelling the outer one cancels them
+    too. A cancelled call returns right away, even with a request in
+    flight; that request is abandoned and may still reach the server.
+
+    A `timeout` of None means no time limit, only cancellation.
+    """
+
+    def __init__(
+        self,
+        timeout: Optional[float] = None,
+        parent: Optional["Deadline"] = None,
+    ) -> None:
+        self.expires = None if timeout is None else time.monotonic() + timeout
+        self.parent = parent
+        self._cancelled = threading.Event()
+        self._children: List["Deadline"] = []
+        # Events to set on cancellation, to wake up waiting callers.
+        self._wakeups: List[threading.Event] = []
+
+    def __enter__(self) -> "Deadline":
+        if self.parent is None:
+            self.parent = current_deadline()
+        if self.parent is not None:
+            self.parent._children.append(self)
+            if self.parent.cancelled:
+                self._cancelled.set()
+        if not hasattr(_local, "deadlines"):
+            _local.deadlines = []
+        _local.deadlines.append(self)
+        return self
+
+    def __exit__(self, type, value, tb) -> None:
+        _local.deadlines.remove(self)
+        if self.parent is not None:
+            self.parent._children.remove(self)
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None if there is no time limit."""
+
+        left = None
+        if self.expires is not None:
+            left = self.expires - time.monotonic()
+        if self.parent is not None:
+            outer = self.parent.remaining()
+            if outer is not None and (left is None or outer < left):
+                left = outer
+        return left
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self) -> None:
+        """Make the calls running under this deadline give up."""
+
+        self._cancelled.set()
+        for event in list(self._wakeups):
+            event.set()
+        for child in list(self._children):
+            child.cancel()
+
+    def check(self) -> None:
+        """Raise if the deadline has been cancelled or has passed.
+
+        :raises RequestCancelledError: If it was cancelled.
+        :raises DeadlineExceededError: If no time is left.
+        """
+
+        if self.cancelled:
+            raise RequestCancelledError()
+        left = self.remaining()
+        if left is not None and left <= 0:
+            raise DeadlineExceededError()
+
+    def sleep(self, seconds: float) -> None:
+        """Wait for `seconds`, raising early as described in `check` if
+        the deadline is cancelled or would pass in the meantime.
+        """
+
+        left = self.remaining()
+        if left is not None and left < seconds:
+            raise DeadlineExceededError()
+        if self._cancelled.wait(seconds):
+            raise RequestCancelledError()
+
+    def wait(
+        self, event: threading.Event, timeout: Optional[float] = None
+    ) -> bool:
+        """Wait until `event` is set, or for at most `timeout` seconds.
+        Cancelling the deadline sets it. Return whether it is set.
+
+        :raises RequestCancelledError: If the deadline was cancelled.
+        """
+
+        self._wakeups.append(event)
+        try:
+            if not self.cancelled:
+                event.wait(timeout)
+        finally:
+            self._wakeups.remove(event)
+        if self.cancelled:
+            raise RequestCancelledError()
+        return event.is_set()
+
+
+class LatencyTracker(object):
+    """The latencies of the most recent requests to one endpoint class,
+    from which the read timeout of the next request is derived.
+    """
+
+    def __init__(self, samples: int = LATENCY_SAMPLES) -> None:
+        self._samples: deque = deque(maxlen=samples)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Get the `q`-th percentile (0-100) of the recorded latencies,
+        or None if there are none yet.
+        """
+
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(int(len(samples) * q / 100), len(samples) - 1)
+        return samples[index]
+
+    def timeout(self) -> float:
+        """The read timeout for the next request: a multiple of the 95th
+        percentile latency, within `READ_TIMEOUT_MIN` and
+        `READ_TIMEOUT_MAX`.
+        """
+
+        p95 = self.percentile(95)
+        if p95 is None:
+            return READ_TIMEOUT_MAX
+        return min(
+            max(p95 * READ_TIMEOUT_FACTOR, READ_TIMEOUT_MIN), READ_TIMEOUT_MAX
+        )
+
+
+def endpoint_class(url: str) -> str:
+    """Get the endpoint class of a URL: its host and path, with device
+    IDs and the query left out, e.g. `host/v1/service/devices/*`.
+    """
+
+    parsed = urlparse(url)
+    parts = parsed.path.split("/")
+    for i in range(1, len(parts)):
+        if parts[i - 1] in ("devices", "aircon") and parts[i]:
+            parts[i] = "*"
+    return parsed.netloc + "/".join(parts)
+
 
-def retry_session():
-    """Get a Requests session that retries HTTP and HTTPS requests."""
+class CircuitBreaker(object):
+    """Tracks the failures of one endpoint class, so that requests fail
+    fast while it is down.
+
+    The circuit is closed normally. It opens after `threshold` failed
+    attempts in a row; requests then raise `CircuitOpenError` without
+    being sent. After `reset_timeout` seconds it is half-open: a single
+    trial request is let through, which closes the circuit if it
+    succeeds and opens it again if it fails.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(
+        self,
+        endpoint: str,
+        threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = CIRCUIT_RESET_TIMEOUT,
+    ) -> None:
+        self.endpoint = endpoint
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened: Optional[float] = None
+        self._trial: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now: float) -> str:
+        if self._opened is None:
+            return self.CLOSED
+        if now - self._opened < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def check(self) -> None:
+        """Claim permission to send a request.
+
+        :raises CircuitOpenError: If the circuit is open, or half-open
+            with the trial request already under way.
+        """
+
+        with self._lock:
+            now = time.monotonic()
+            state = self._state(now)
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and (
+                # A trial that was abandoned does not block forever.
+                self._trial is None
+                or now - self._trial >= self.reset_timeout
+            ):
+                self._trial = now
+                return
+            retry_in = self._opened + self.reset_timeout - now
+        raise CircuitOpenError(self.endpoint, max(retry_in, 0))
+
+    def add_success(self) -> None:
+        with self._lock:
+            if self._opened is not None:
+                LOGGER.info("%s is back, closing circuit", self.endpoint)
+            self.failures = 0
+            self._opened = None
+            self._trial = None
+
+    def add_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            now = time.monotonic()
+            if self._trial is not None or (
+                self._opened is None and self.failures >= self.threshold
+            ):
+                LOGGER.warning(
+                    "%s is failing, opening circuit for %ss",
+                    self.endpoint,
+                    self.reset_timeout,
+                )
+                self._opened = now
+                self._trial = None
+
+
+class RetryBudget(object):
+    """Limits retries to a share of the recent requests, so that an
+    outage does not multiply the load with retries of doomed requests.
+    """
+
+    def __init__(
+        self,
+        ratio: float = RETRY_BUDGET_RATIO,
+        minimum: int = RETRY_BUDGET_MIN,
+        window: float = RETRY_BUDGET_WINDOW,
+    ) -> None:
+        self.ratio = ratio
+        self.minimum = minimum
+        self.window = window
+        self._requests: deque = deque()
+        self._retries: deque = deque()
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float) -> None:
+        for times in (self._requests, self._retries):
+            while times and now - times[0] > self.window:
+                times.popleft()
+
+    def add_request(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            self._requests.append(now)
+
+    def withdraw(self) -> bool:
+        """Take a retry out of the budget. Return False if it is spent."""
+
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            allowed = self.minimum + self.ratio * len(self._requests)
+            if len(self._retries) >= allowed:
+                LOGGER.debug("Retry budget spent")
+                return False
+            self._retries.append(now)
+            return True
+
+
+def retry_session(
+    pool_maxsize: int = DEFAULT_POOLSIZE, retries: int = RETRY_COUNT
+):
+    """Get a Requests session that retries HTTP and HTTPS requests.
+
+    `pool_maxsize` is the number of keep-alive connections kept per host,
+    `retries` the number of times a failed request is retried.
+    """
     # Adapted from:
     # https://www.peterbe.com/plog/best-practice-with-retries-with-requests
     session = requests.Session()
     retry = Retry(
-        total=RETRY_COUNT,
-        read=RETRY_COUNT,
-        connect=RETRY_COUNT,
+        total=retries,
+        read=retries,
+        connect=retries,
         backoff_factor=RETRY_FACTOR,
         status_forcelist=RETRY_STATUSES,
     )
-    adapter = HTTPAdapter(max_retries=retry)
+    adapter = HTTPAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=pool_maxsize,
+        max_retries=retry if retries else 0,
+    )
     session.mount("http://", adapter)
     session.mount("https://", adapter)
     return session
 
 
+def _iter_body(res: requests.Response):
+    """Iterate over the body of a streamed response in chunks of at
+    most `RECEIVE_CHUNK_SIZE` bytes, each returned as soon as it has
+    arrived (`iter_content` waits for full chunks).
+    """
+
+    read1 = getattr(res.raw, "read1", None)
+    if read1 is None:  # urllib3 1.x
+        yield from res.iter_content(RECEIVE_CHUNK_SIZE)
+        return
+    while True:
+        # Map errors like `iter_content` does.
+        try:
+            chunk = read1(RECEIVE_CHUNK_SIZE, decode_content=True)
+        except urllib3.exceptions.ReadTimeoutError as exc:
+            raise requests.ConnectionError(exc)
+        except urllib3.exceptions.ProtocolError as exc:
+            raise requests.exceptions.ChunkedEncodingError(exc)
+        except urllib3.exceptions.DecodeError as exc:
+            raise requests.exceptions.ContentDecodingError(exc)
+        if not chunk:
+            return
+        yield chunk
+
+
+class Transport(object):
+    """A long-lived, pooled HTTP session shared by API requests.
+
+    Connections are kept alive between calls so that polls, controls and
+    token refreshes reuse the same TCP/TLS connection to the LG servers.
+    When the pool sits idle for longer than `idle_timeout` seconds, its
+    connections are closed by a timer and a fresh pool is built on the
+    next request. `close` closes them right away.
+
+    Requests should be made through `request`, which retries them within
+    a `Deadline` and times out each GET attempt based on the latency
+    observed for its endpoint class.
+
+    With `hedge` set, a GET that has not been answered within the usual
+    latency of its endpoint (the `HEDGE_PERCENTILE`) is sent a second time,
+    and whichever response comes first is used. `hedges_fired` and
+    `hedges_won` count how often that happened and how often the second
+    request was the faster one.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = POOL_MIN_SIZE,
+        idle_timeout: float = POOL_IDLE_TIMEOUT,
+        hedge: bool = False,
+    ) -> None:
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self._session: Optional[requests.Session] = None
+        self._last_used = 0.0
+        self._evictor: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+        self._latency: Dict[str, LatencyTracker] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        # One event per `_attempt` running, set to make it stop reading,
+        # and the helper threads sending its requests.
+        self._in_flight: Set[threading.Event] = set()
+        self._threads: Set[threading.Thread] = set()
+        #: Limits retries across all endpoints of this transport.
+        self.retry_budget = RetryBudget()
+
+        self.hedge = hedge
+        #: Limits the extra requests sent by hedging.
+        self.hedge_budget = RetryBudget(HEDGE_BUDGET_RATIO, 1)
+        self.hedges_fired = 0
+        self.hedges_won = 0
+
+    @property
+    def session(self) -> requests.Session:
+        """The pooled Requests session, rebuilt if it has been idle."""
+
+        with self._lock:
+            now = time.monotonic()
+            if (
+                self._session is not None
+                and now - self._last_used > self.idle_timeout
+            ):
+                LOGGER.debug("Closing idle HTTP connections")
+                self._session.close()
+                self._session = None
+            if self._session is None:
+                # `request` retries itself, within the caller's deadline.
+                self._session = retry_session(self.pool_size, retries=0)
+            self._last_used = now
+            if self._evictor is None:
+                self._schedule_eviction(self.idle_timeout)
+            return self._session
+
+    def _schedule_eviction(self, delay: float) -> None:
+        # Called with `_lock` held.
+        self._evictor = threading.Timer(delay, self._evict_idle)
+        self._evictor.daemon = True
+        self._evictor.start()
+
+    def _evict_idle(self) -> None:
+        """Close the pooled connections if they have been idle for
+        `idle_timeout`, or check again when they will have been.
+        """
+
+        with self._lock:
+            self._evictor = None
+            if self._session is None:
+                return
+            idle = time.monotonic() - self._last_used
+            if idle >= self.idle_timeout and not self._in_flight:
+                LOGGER.debug("Closing idle HTTP connections")
+                self._session.close()
+                self._session = None
+            else:
+                self._schedule_eviction(max(self.idle_timeout - idle, 1))
+
+    def breaker(self, url: str) -> "CircuitBreaker":
+        """Get the circuit breaker for the endpoint class of `url`."""
+
+        endpoint = endpoint_class(url)
+        with self._lock:
+            if endpoint not in self._breakers:
+                self._breakers[endpoint] = CircuitBreaker(endpoint)
+            return self._breakers[endpoint]
+
+    def latency(self, url: str, method: str = "GET") -> LatencyTracker:
+        """Get the latency tracker for `method` requests to the endpoint
+        class of `url`.
+        """
+
+        key = "{} {}".format(method.upper(), endpoint_class(url))
+        with self._lock:
+            if key not in self._latency:
+                self._latency[key] = LatencyTracker()
+            return self._latency[key]
+
+    def request(
+        self, method: str, url: str, deadline: Optional[Deadline] = None, **kw
+    ) -> requests.Response:
+        """Send an HTTP request, retrying connection failures and the
+        `RETRY_STATUSES` with exponential back-off.
+
+        Everything must finish within `deadline`, by default the current
+        thread's (see `Deadline`) or else one of `REQUEST_DEADLINE`
+        seconds. Requests other than GETs are only retried if they could
+        not be sent at all, so controls are never applied twice.
+
+        Attempts are counted by the `CircuitBreaker` of the endpoint, and
+        retries are only made while `retry_budget` allows.
+
+        :raises DeadlineExceededError: If time ran out.
+        :raises RequestCancelledError: If the deadline was cancelled.
+        :raises CircuitOpenError: If the endpoint is failing.
+        """
+
+        if deadline is None:
+            deadline = current_deadline() or Deadline(REQUEST_DEADLINE)
+        idempotent = method.upper() == "GET"
+        tracker = self.latency(url, method)
+        breaker = self.breaker(url)
+        self.retry_budget.add_request()
+        hedge_after = None
+        if idempotent and self.hedge:
+            self.hedge_budget.add_request()
+            if len(tracker) >= HEDGE_MIN_SAMPLES:
+                hedge_after = tracker.percentile(HEDGE_PERCENTILE)
+
+        for attempt in range(RETRY_COUNT + 1):
+            deadline.check()
+            breaker.check()
+            # Other requests are not retried, so a timeout that is too
+            # short would fail a control the device may have applied.
+            read = tracker.timeout() if idempotent else READ_TIMEOUT_MAX
+            connect = CONNECT_TIMEOUT
+            left = deadline.remaining()
+            if left is not None:
+                connect, read = min(connect, left), min(read, left)
+
+            try:
+                res = self._attempt(
+                    deadline,
+                    method,
+                    url,
+                    hedge_after,
+                    timeout=(connect, read),
+                    **kw,
+                )
+            except requests.ConnectTimeout as exc:
+                breaker.add_failure()
+                error: Exception = exc
+            except requests.ReadTimeout as exc:
+                breaker.add_failure()
+                # Let slow responses raise the timeout of later attempts.
+                tracker.add(read)
+                if not idempotent:
+                    raise
+                error = exc
+            except requests.ConnectionError as exc:
+                breaker.add_failure()
+                if not idempotent:
+                    raise
+                error = exc
+            else:
+                if res.status_code >= 500:
+                    breaker.add_failure()
+                else:
+                    breaker.add_success()
+                if res.status_code not in RETRY_STATUSES or not idempotent:
+                    return res
+                error = requests.HTTPError(
+                    "{} {}".format(res.status_code, res.reason), response=res
+                )
+
+            if attempt == RETRY_COUNT or not self.retry_budget.withdraw():
+                raise error
+            LOGGER.debug("Retrying %s %s after %r", method, url, error)
+            try:
+                deadline.sleep(RETRY_FACTOR * (2 ** attempt))
+            except DeadlineExceededError:
+                raise DeadlineExceededError() from error
+
+    def _attempt(
+        self,
+        deadline: Deadline,
+        method,
+        url,
+        hedge_after: Optional[float] = None,
+        **kw,
+    ):
+        """Send a request on a helper thread, so that the caller can give
+        up when `deadline` passes or is cancelled, even while the
+        response is still coming in.
+
+        If there is no response after `hedge_after` seconds, the request
+        is sent again, if `hedge_budget` allows, and the first response
+        is returned. The latency of each response is recorded.
+
+        :raises DeadlineExceededError: If time ran out.
+        :raises RequestCancelledError: If the deadline was cancelled.
+        """
+
+        tracker = self.latency(url, method)
+        done = threading.Event()
+        # Set once the caller no longer wants the responses, so that the
+        # helper threads stop reading and release their connections.
+        abandon = threading.Event()
+        results: queue.Queue = queue.Queue()
+
+        def send(index):
+            start = time.monotonic()
+            try:
+                res = self._receive(method, url, abandon, **kw)
+            except Exception as exc:
+                results.put((index, exc))
+            else:
+                tracker.add(time.monotonic() - start)
+                results.put((index, res))
+            finally:
+                with self._lock:
+                    self._threads.discard(threading.current_thread())
+            done.set()
+
+        def start(index):
+            thread = threading.Thread(
+                target=send, args=(index,), name="wideq-request", daemon=True
+            )
+            with self._lock:
+                self._threads.add(thread)
+            thread.start()
+
+        def wait(timeout):
+            left = deadline.remaining()
+            if left is not None and (timeout is None or left < timeout):
+                if not deadline.wait(done, max(left, 0)):
+                    raise DeadlineExceededError()
+                return True
+            return deadline.wait(done, timeout)
+
+        with self._lock:
+            self._in_flight.add(abandon)
+        try:
+            start(0)
+            sent = 1
+            if (
+                hedge_after is not None
+                and not wait(hedge_after)
+                and self.hedge_budget.withdraw()
+            ):
+                LOGGER.debug("No response after %.2fs, hedging", hedge_after)
+                with self._lock:
+                    self.hedges_fired += 1
+                start(1)
+                sent = 2
+
+            # Use the first response; an error only if all requests failed.
+            for received in range(sent):
+                done.clear()
+                if results.empty():
+                    wait(None)
+                index, result = results.get_nowait()
+                if isinstance(result, Exception) and received + 1 < sent:
+                    continue
+                if index == 1 and not isinstance(result, Exception):
+                    with self._lock:
+                        self.hedges_won += 1
+                break
+        finally:
+            abandon.set()
+            with self._lock:
+                self._in_flight.discard(abandon)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _receive(self, method, url, abandon: threading.Event, **kw):
+        """Send a request and read its body, giving up between chunks
+        once `abandon` is set.
+        """
+
+        res = self.session.request(method, url, stream=True, **kw)
+        body = bytearray()
+        try:
+            for chunk in _iter_body(res):
+                if abandon.is_set():
+                    raise RequestCancelledError()
+                body.extend(chunk)
+        finally:
+            res.close()
+        # What `Response.content` would have read, had we not streamed.
+        res._content = bytes(body)
+        return res
+
+    def resize(self, device_count: int) -> None:
+        """Scale the per-host pool to the number of managed devices."""
+
+        size = min(max(POOL_MIN_SIZE, device_count + 1), POOL_MAX_SIZE)
+        with self._lock:
+            if size == self.pool_size:
+                return
+            self.pool_size = size
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def close(self, timeout: float = CLOSE_TIMEOUT) -> None:
+        """Close all pooled connections, and stop reading the responses
+        to requests still in flight.
+
+        Waits up to `timeout` seconds for the threads sending those
+        requests to end, so none outlive the caller.
+        """
+
+        with self._lock:
+            for abandon in self._in_flight:
+                abandon.set()
+            evictor = self._evictor
+            if evictor is not None:
+                evictor.cancel()
+                self._evictor = None
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+            threads = list(self._threads)
+
+        if evictor is not None and evictor is not threading.current_thread():
+            evictor.join()
+
+        end = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(end - time.monotonic(), 0))
+            if thread.is_alive():
+                LOGGER.warning("HTTP request still running after close")
+                break
+
+
+#: The process-wide transport for requests made outside of a `Session`,
+#: like gateway discovery and OAuth token requests.
+TRANSPORT = Transport()
+
+
+def close_transport() -> None:
+    """Close the connections of `TRANSPORT` and stop its idle timer, e.g.
+    when a plugin stops. It reconnects if it is used again.
+    """
+
+    TRANSPORT.close()
+
+
 def set_log_level(level: int):
     logger = get_wideq_logger()
     logger.setLevel(level)
@@ -178,6 +932,31 @@ class TokenError(APIError):
         pass
 
 
+class DeadlineExceededError(APIError):
+    """A request did not finish before its `Deadline`."""
+
+    def __init__(self):
+        pass
+
+
+class RequestCancelledError(APIError):
+    """A request was given up because its `Deadline` was cancelled."""
+
+    def __init__(self):
+        pass
+
+
+class CircuitOpenError(APIError):
+    """Requests to an endpoint are failing fast, as it failed repeatedly
+    (see `CircuitBreaker`). `retry_in` is the time in seconds until a
+    request is tried again.
+    """
+
+    def __init__(self, endpoint, retry_in):
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
 class FailedRequestError(APIError):
     """A failed request typically indicates an unsupported control on a
     device.
@@ -188,7 +967,7 @@ class InvalidRequestError(APIError):
     """The server rejected a request as invalid."""
 
 
-class DeviceNotFoundError:
+class DeviceNotFoundError(Exception):
     """The device couldn't be found."""
 
 
@@ -224,30 +1003,19 @@ class RequestMethod(Enum):
     POST = "post"
 
 
-def thinq_request(
-    method,
-    url,
-    data=None,
+def thinq_headers(
     access_token=None,
-    session_id=None,
     user_number=None,
     country=DEFAULT_COUNTRY,
     language=DEFAULT_LANGUAGE,
-):
-    """Make an HTTP request in the format used by the API servers.
-
-    In this format, the request POST data sent as JSON under a special
-    key; authentication sent in headers. Return the JSON data extracted
-    from the response.
+    client_id=CLIENT_ID,
+) -> Dict[str, str]:
+    """Build the headers sent with every request to the API servers."""
 
-    The `access_token` and `session_id` are required for most normal,
-    authenticated requests. They are not required, for example, to load
-    the gateway server data or to start a session.
-    """
     headers = {
         "Accept": "application/json",
         "x-api-key": API_KEY,
-        "x-client-id": CLIENT_ID,
+        "x-client-id": client_id,
         "x-country-code": country,
         "x-language-code": language,
         "x-message-id": MESSAGE_ID,
@@ -264,15 +1032,15 @@ def thinq_request(
     if user_number:
         headers["x-user-no"] = user_number
 
-    with retry_session() as session:
-        if method == RequestMethod.POST:
-            res = session.post(url, json=data, headers=headers)
-        elif method == RequestMethod.GET:
-            res = session.get(url, headers=headers)
-        else:
-            raise ValueError("Unsupported request method")
+    return headers
 
-    out = res.json()
+
+def thinq_result(out: Dict[str, Any]) -> Any:
+    """Extract the payload from a decoded API response.
+
+    Raise the matching `APIError` subclass from `API_ERRORS` if the
+    server reported a failure.
+    """
 
     # Check for API errors.
     if RETURN_CODE_ROOT in out:
@@ -286,6 +1054,54 @@ def thinq_request(
     return out[DATA_ROOT]
 
 
+def thinq_request(
+    method,
+    url,
+    data=None,
+    access_token=None,
+    session_id=None,
+    user_number=None,
+    country=DEFAULT_COUNTRY,
+    language=DEFAULT_LANGUAGE,
+    transport=None,
+    client_id=CLIENT_ID,
+    rate_limiter=None,
+):
+    """Make an HTTP request in the format used by the API servers.
+
+    In this format, the request POST data sent as JSON under a special
+    key; authentication sent in headers. Return the JSON data extracted
+    from the response.
+
+    The `access_token` and `session_id` are required for most normal,
+    authenticated requests. They are not required, for example, to load
+    the gateway server data or to start a session.
+
+    Requests go through `transport`'s connection pool, or the shared
+    `TRANSPORT` if none is given, and are bounded by the current
+    thread's `Deadline` (see `Transport.request`). With a `rate_limiter`
+    (see `wideq.ratelimit`), they wait for their turn first.
+    """
+    headers = thinq_headers(
+        access_token, user_number, country, language, client_id
+    )
+
+    transport = transport or TRANSPORT
+    deadline = current_deadline() or Deadline(REQUEST_DEADLINE)
+    if rate_limiter is not None:
+        rate_limiter.acquire(user_number or "", url, deadline)
+    if method == RequestMethod.POST:
+        res = transport.request(
+            "POST", url, deadline, json=data, headers=headers
+        )
+    elif method == RequestMethod.GET:
+        res = transport.request("GET", url, deadline, headers=headers)
+    else:
+        raise ValueError("Unsupported request method")
+
+    return thinq_result(res.json())
+
+
 def oauth_url(auth_base, country, language):
     """Construct the URL for users to log in (in a browser) to start an
     authenticated session.
@@ -322,12 +1138,24 @@ def parse_oauth_callback(url):
     )
 
 
+def energy_history_path(device_id, type="hour", start_date="", end_date=""):
+    """Build the API path of a device's energy consumption history."""
+
+    # if dates not provided, set them to today date
+    if start_date == "":
+        start_date = strftime(f"%Y-%m-%d")
+    if end_date == "":
+        end_date = strftime(f"%Y-%m-%d")
+
+    return f"service/aircon/{device_id}/energy-history?period={type}&startDate={start_date}&endDate={end_date}"
+
+
 class OAuthGrant(Enum):
     REFRESH_TOKEN = "refresh_token"
     AUTHORIZATION_CODE = "authorization_code"
 
 
-def oauth_request(grant, oauth_root, token):
+def oauth_request(grant, oauth_root, token, transport=None):
     """Make an oauth_request with a specific grant type
 
     May raise a `TokenError`.
@@ -368,8 +1196,9 @@ def oauth_request(grant, oauth_root, token):
         "Accept": "application/json",
     }
 
-    with retry_session() as session:
-        res = session.post(token_url, data=data, headers=headers)
+    res = (transport or TRANSPORT).request(
+        "POST", token_url, data=data, headers=headers
+    )
     res_data = res.json()
 
     if res.status_code != 200:
@@ -378,6 +1207,18 @@ def oauth_request(grant, oauth_root, token):
     return res_data
 
 
+def token_expiry(out: Dict[str, Any]) -> float:
+    """Get the time (a `time.time()` timestamp) at which the access
+    token in an OAuth response expires.
+    """
+
+    try:
+        lifetime = float(out["expires_in"])
+    except (KeyError, TypeError, ValueError):
+        lifetime = TOKEN_LIFETIME
+    return time.time() + lifetime
+
+
 class Gateway(object):
     def __init__(self, auth_base, api_root, country, language):
         self.auth_base = auth_base
@@ -424,7 +1265,13 @@ class Gateway(object):
 
 class Auth(object):
     def __init__(
-        self, gateway, access_token, refresh_token, user_number, oauth_root
+        self,
+        gateway,
+        access_token,
+        refresh_token,
+        user_number,
+        oauth_root,
+        expires_at=None,
     ):
         self.gateway = gateway
         self.access_token = access_token
@@ -432,6 +1279,18 @@ class Auth(object):
         self.user_number = user_number
         self.oauth_root = oauth_root
 
+        # When `access_token` expires, as a `time.time()` timestamp, or
+        # None if that is not known.
+        self.expires_at: Optional[float] = expires_at
+
+        # Called with this object after `refresh_in_place` got a new
+        # access token, e.g. to persist it.
+        self.on_refresh: Optional[Callable[["Auth"], None]] = None
+
+        self._refresh_lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+        self._refresher_stop = threading.Event()
+
     @classmethod
     def from_url(cls, gateway, url):
         """Create an authentication using an OAuth callback URL."""
@@ -446,43 +1305,167 @@ class Auth(object):
             out["refresh_token"],
             user_number,
             oauth_root,
+            token_expiry(out),
         )
 
-    def start_session(self) -> Tuple["Session", List[Dict[str, Any]]]:
+    def start_session(
+        self, transport: Optional[Transport] = None
+    ) -> Tuple["Session", List[Dict[str, Any]]]:
         """Start an API session for the logged-in user. Return the
         Session object and a list of the user's devices.
+
+        The session sends its requests through `transport`, or a new
+        `Transport` of its own.
         """
-        return Session(self), []
+        return Session(self, transport=transport), []
 
     def refresh(self):
         """Refresh the authentication, returning a new Auth object."""
 
-        new_access_token = oauth_request(
+        out = oauth_request(
             OAuthGrant.REFRESH_TOKEN, self.oauth_root, self.refresh_token
-        )["access_token"]
+        )
         return Auth(
             self.gateway,
-            new_access_token,
+            out["access_token"],
             self.refresh_token,
             self.user_number,
             self.oauth_root,
+            token_expiry(out),
         )
 
-    def serialize(self) -> Dict[str, str]:
-        return {
+    @property
+    def expires_soon(self) -> bool:
+        """Whether the access token expires within `TOKEN_REFRESH_MARGIN`
+        seconds, or its expiry is not known.
+        """
+
+        return (
+            self.expires_at is None
+            or time.time() >= self.expires_at - TOKEN_REFRESH_MARGIN
+        )
+
+    def refresh_in_place(self, stale_token=None) -> None:
+        """Get a new access token for this object.
+
+        Concurrent callers share a single refresh. Pass the token that
+        was found to be expired as `stale_token`: if another caller has
+        replaced it in the meantime, nothing is requested.
+
+        May raise a `TokenError`.
+        """
+
+        with self._refresh_lock:
+            if stale_token is not None and self.access_token != stale_token:
+                return
+            out = oauth_request(
+                OAuthGrant.REFRESH_TOKEN, self.oauth_root, self.refresh_token
+            )
+            self.access_token = out["access_token"]
+            self.expires_at = token_expiry(out)
+            LOGGER.debug("Access token refreshed")
+        if self.on_refresh is not None:
+            try:
+                self.on_refresh(self)
+            except Exception:
+                LOGGER.exception("Access token refresh callback failed")
+
+    def ensure_fresh(self) -> None:
+        """Refresh the access token if it is about to expire."""
+
+        token = self.access_token
+        if self.expires_soon:
+            self.refresh_in_place(token)
+
+    def start_refresher(self) -> None:
+        """Refresh the access token ahead of its expiry on a background
+        thread, so requests never wait for it.
+        """
+
+        if self._refresher is not None and self._refresher.is_alive():
+            return
+        self._refresher_stop.clear()
+        self._refresher = threading.Thread(
+            target=self._refresh_loop, name="wideq-token", daemon=True
+        )
+        self._refresher.start()
+
+    def stop_refresher(self) -> None:
+        """Stop the thread started by `start_refresher`."""
+
+        self._refresher_stop.set()
+        if self._refresher is not None:
+            self._refresher.join()
+            self._refresher = None
+
+    def _refresh_loop(self) -> None:
+        while not self._refresher_stop.is_set():
+            try:
+                self.ensure_fresh()
+            except (
+                APIError,
+                requests.RequestException,
+                KeyError,
+                ValueError,
+            ) as exc:
+                LOGGER.warning("Could not refresh access token: %r", exc)
+                delay = TOKEN_RETRY_DELAY
+            else:
+                delay = self.expires_at - TOKEN_REFRESH_MARGIN - time.time()
+            self._refresher_stop.wait(max(delay, 1))
+
+    def serialize(self) -> Dict[str, Any]:
+        out = {
             "access_token": self.access_token,
             "refresh_token": self.refresh_token,
             "user_number": self.user_number,
             "oauth_root": self.oauth_root,
         }
+        if self.expires_at is not None:
+            out["expires_at"] = self.expires_at
+        return out
+
+
+def monitor_result(device_id, work: Dict[str, Any]) -> Optional[bytes]:
+    """Decode one entry of the `workList` returned by `rti/rtiResult`.
+
+    Return the status data, or None if the monitoring is not yet ready.
+    Raise a `MonitorError` if the device reported an error.
+    """
+
+    # When monitoring first starts, it usually takes a few
+    # iterations before data becomes available. In the initial
+    # "warmup" phase, `returnCode` is missing from the response.
+    if "returnCode" not in work:
+        return None
+
+    # Check for errors.
+    code = work.get("returnCode")  # returnCode can be missing.
+    if code != "0000":
+        raise MonitorError(device_id, code)
+
+    # The return data may or may not be present, depending on the
+    # monitoring task status.
+    if "returnData" in work:
+        # The main response payload is base64-encoded binary data in
+        # the `returnData` field. This sometimes contains JSON data
+        # and sometimes other binary data.
+        return base64.b64decode(work["returnData"])
+    else:
+        return None
 
 
 class Session(object):
-    def __init__(self, auth, session_id=None) -> None:
+    def __init__(
+        self, auth, session_id=None, transport=None, rate_limiter=None
+    ) -> None:
         self.auth = auth
         self.session_id = session_id
+        self.transport: Transport = transport or Transport()
+        # Optional `wideq.ratelimit.RateLimiter` for API requests.
+        self.rate_limiter = rate_limiter
 
-    def post(self, path, data=None):
+    def post(self, path, data=None, client_id=CLIENT_ID):
         """Make a POST request to the API server.
 
         This is like `lgedm_post`, but it pulls the context for the
@@ -490,31 +1473,85 @@ class Session(object):
         """
 
         url = urljoin(self.auth.gateway.api_root + "/", path)
+        return self._request(RequestMethod.POST, url, data, client_id)
+
+    def get(self, path, client_id=CLIENT_ID):
+        """Make a GET request to the API server.
+
+        This is like `lgedm_get`, but it pulls the context for the
+        request from an active Session.
+        """
+
+        url = urljoin(self.auth.gateway.api_root + "/", path)
+        return self._request(RequestMethod.GET, url, None, client_id)
+
+    def _request(self, method, url, data, client_id):
+        """Make an authenticated request.
+
+        A token known to be about to expire is refreshed first. If the
+        server still reports it as expired, the token is refreshed and
+        the request retried once.
+        """
+
+        if self.auth.expires_at is not None and self.auth.expires_soon:
+            self.auth.ensure_fresh()
+        token = self.auth.access_token
+        try:
+            return self._send(method, url, data, client_id, token)
+        except NotLoggedInError:
+            LOGGER.debug("Access token rejected, refreshing")
+            self.auth.refresh_in_place(token)
+            return self._send(
+                method, url, data, client_id, self.auth.access_token
+            )
+
+    def _send(self, method, url, data, client_id, access_token):
         return thinq_request(
-            RequestMethod.POST,
+            method,
             url,
             data,
-            access_token=self.auth.access_token,
+            access_token=access_token,
             user_number=self.auth.user_number,
             country=self.auth.gateway.country,
             language=self.auth.gateway.language,
+            transport=self.transport,
+            client_id=client_id,
+            rate_limiter=self.rate_limiter,
         )
 
-    def get(self, path):
-        """Make a GET request to the API server.
-
-        This is like `lgedm_get`, but it pulls the context for the
-        request from an active Session.
+    def get_route(self) -> Dict[str, Any]:
+        """Get the addresses of the regional servers, including the MQTT
+        broker (`mqttServer`).
         """
 
-        url = urljoin(self.auth.gateway.api_root + "/", path)
         return thinq_request(
             RequestMethod.GET,
-            url,
-            access_token=self.auth.access_token,
-            user_number=self.auth.user_number,
+            ROUTE_URL,
             country=self.auth.gateway.country,
             language=self.auth.gateway.language,
+            transport=self.transport,
+        )
+
+    def register_client(self, client_id) -> None:
+        """Register `client_id` to receive push messages for the user's
+        devices.
+        """
+
+        self.post("service/users/client", client_id=client_id)
+
+    def register_certificate(self, client_id, csr) -> Dict[str, Any]:
+        """Get a certificate for connecting to the MQTT broker as
+        `client_id`.
+
+        `csr` is a PEM encoded certificate signing request. Return a dict
+        with the `certificatePem` and the topics (`subscriptions`) to
+        subscribe to.
+        """
+
+        return self.post(
+            "service/users/client/certificate",
+            {"csr": csr},
+            client_id=client_id,
         )
 
     def get_devices(self) -> List[Dict[str, Any]]:
@@ -525,6 +1562,13 @@ class Session(object):
 
         return get_list(self.get("service/application/dashboard"), "item")
 
+    def get_device(self, device_id) -> Dict[str, Any]:
+        """Get information about a single device, including its current
+        status snapshot.
+        """
+
+        return self.get("service/devices/{}".format(device_id))
+
     def monitor_start(self, device_id):
         """Begin monitoring a device's status.
 
@@ -543,6 +1587,31 @@ class Session(object):
         )
         return res["workId"]
 
+    def monitor_start_many(self, device_ids) -> Dict[str, str]:
+        """Begin monitoring several devices with a single request.
+
+        Return a dict mapping each device ID to the "work ID" of its
+        monitoring task.
+        """
+
+        work_list = [
+            {
+                "cmd": "Mon",
+                "cmdOpt": "Start",
+                "deviceId": device_id,
+                "workId": gen_uuid(),
+            }
+            for device_id in device_ids
+        ]
+        res = self.post("rti/rtiMon", {"workList": work_list})
+
+        # Use the work IDs we sent for devices missing from the response.
+        works = {w["deviceId"]: w["workId"] for w in work_list}
+        for w in get_list(res, "workList"):
+            if w.get("deviceId") in works and w.get("workId"):
+                works[w["deviceId"]] = w["workId"]
+        return works
+
     def monitor_poll(self, device_id, work_id):
         """Get the result of a monitoring task.
 
@@ -554,29 +1623,41 @@ class Session(object):
         action is probably to restart the monitoring task.
         """
 
-        work_list = [{"deviceId": device_id, "workId": work_id}]
-        res = self.post("rti/rtiResult", {"workList": work_list})["workList"]
+        result = self.monitor_poll_many({device_id: work_id})[device_id]
+        if isinstance(result, MonitorError):
+            raise result
+        return result
+
+    def monitor_poll_many(
+        self, works: Dict[str, str]
+    ) -> Dict[str, Union[bytes, MonitorError, None]]:
+        """Get the results of several monitoring tasks with a single
+        request.
+
+        `works` maps device IDs to the work IDs retrieved from
+        `monitor_start` or `monitor_start_many`. Return a dict with the
+        same keys holding each device's result as `monitor_poll` would
+        return it, or the `MonitorError` it would have raised.
+        """
 
-        # When monitoring first starts, it usually takes a few
-        # iterations before data becomes available. In the initial
-        # "warmup" phase, `returnCode` is missing from the response.
-        if "returnCode" not in res:
-            return None
+        work_list = [
+            {"deviceId": device_id, "workId": work_id}
+            for device_id, work_id in works.items()
+        ]
+        res = self.post("rti/rtiResult", {"workList": work_list})
 
-        # Check for errors.
-        code = res.get("returnCode")  # returnCode can be missing.
-        if code != "0000":
-            raise MonitorError(device_id, code)
-
-        # The return data may or may not be present, depending on the
-        # monitoring task status.
-        if "returnData" in res:
-            # The main response payload is base64-encoded binary data in
-            # the `returnData` field. This sometimes contains JSON data
-            # and sometimes other binary data.
-            return base64.b64decode(res["returnData"])
-        else:
-            return None
+        results: Dict[str, Union[bytes, MonitorError, None]] = dict.fromkeys(
+            works
+        )
+        for work in get_list(res, "workList"):
+            device_id = work.get("deviceId")
+            if device_id not in works:
+                continue
+            try:
+                results[device_id] = monitor_result(device_id, work)
+            except MonitorError as exc:
+                results[device_id] = exc
+        return results
 
     def monitor_stop(self, device_id, work_id):
         """Stop monitoring a device."""
@@ -591,6 +1672,24 @@ class Session(object):
             },
         )
 
+    def monitor_stop_many(self, works: Dict[str, str]) -> None:
+        """Stop monitoring several devices with a single request.
+
+        `works` maps device IDs to work IDs, as returned by
+        `monitor_start_many`.
+        """
+
+        work_list = [
+            {
+                "cmd": "Mon",
+                "cmdOpt": "Stop",
+                "deviceId": device_id,
+                "workId": work_id,
+            }
+            for device_id, work_id in works.items()
+        ]
+        self.post("rti/rtiMon", {"workList": work_list})
+
     def device_control(self, device_id, data):
         """Control a device's settings.
 
@@ -607,14 +1706,9 @@ class Session(object):
         type can be hour, day, month.
         """
 
-        # if dates not provided, set them to today date
-        if start_date == "":
-            start_date = strftime(f"%Y-%m-%d")
-        if end_date == "":
-            end_date = strftime(f"%Y-%m-%d")
-
-        historyPath = \
-            f"service/aircon/{device_id}/energy-history?period={type}&startDate={start_date}&endDate={end_date}"
+        historyPath = energy_history_path(
+            device_id, type, start_date, end_date
+        )
 
         res = self.get(historyPath)
         return res
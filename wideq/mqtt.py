@@ -0,0 +1,309 @@
+"""Push status updates of thinq2 devices over MQTT.
+
+This needs the optional `paho-mqtt` package, and `cryptography` to
+register with LG's broker. Without a connected feed, the `Client` keeps
+polling as before.
+"""
+import json
+import logging
+import os
+import shutil
+import ssl
+import tempfile
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+from . import core
+from .client import Client
+
+try:
+    import paho.mqtt.client as paho_mqtt  # type: ignore
+except ImportError:
+    paho_mqtt = None
+
+try:
+    from cryptography import x509  # type: ignore
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+except ImportError:
+    x509 = None
+
+#: The port of LG's (AWS IoT) broker.
+MQTT_PORT = 8883
+#: Seconds between keep-alive pings.
+MQTT_KEEPALIVE = 60
+#: The file name used next to a state file, see `MQTTFeed.for_state_file`.
+MQTT_STATE_FILE_NAME = "wideq_mqtt.json"
+#: paho's CONNACK codes for a rejected certificate.
+MQTT_AUTH_REFUSED = (4, 5)
+
+LOGGER = logging.getLogger("wideq.mqtt")
+
+
+def make_csr():
+    """Generate a private key and a certificate signing request for it.
+
+    Return both, PEM encoded.
+    """
+
+    if x509 is None:
+        raise ImportError(
+            "MQTT registration requires the cryptography package"
+        )
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    csr = (
+        x509.CertificateSigningRequestBuilder()
+        .subject_name(
+            x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "AWS IoT")])
+        )
+        .sign(key, hashes.SHA256())
+    )
+    key_pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.TraditionalOpenSSL,
+        serialization.NoEncryption(),
+    )
+    return key_pem.decode("ascii"), csr.public_bytes(
+        serialization.Encoding.PEM
+    ).decode("ascii")
+
+
+def tls_context(certificate: str, private_key: str) -> ssl.SSLContext:
+    """Build a TLS context that authenticates with a client certificate,
+    both given PEM encoded.
+    """
+
+    context = ssl.create_default_context()
+    # `load_cert_chain` only takes file names.
+    directory = tempfile.mkdtemp()
+    try:
+        cert_file = os.path.join(directory, "cert.pem")
+        key_file = os.path.join(directory, "key.pem")
+        with open(cert_file, "w") as f:
+            f.write(certificate)
+        fd = os.open(key_file, os.O_WRONLY | os.O_CREAT, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(private_key)
+        context.load_cert_chain(cert_file, key_file)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return context
+
+
+class MQTTFeed(object):
+    """Receive device status pushes and feed them into a `Client`.
+
+    Pushed values are merged into the client's snapshot cache, so
+    `Device` status reads and change subscriptions see them right away.
+    While the feed is connected, snapshots stay fresh for
+    `wideq.client.PUSH_SNAPSHOT_TTL`; when it drops, the client falls
+    back to polling until paho has reconnected.
+
+    By default the broker and topics are looked up and a client
+    certificate is registered with LG's servers on `start`. With a
+    `state_path`, that registration is saved to the file and reused by
+    later starts; it is dropped again if the broker refuses it. Give
+    `host` (and `topics`) to connect to another broker, e.g. a local
+    stand-in, and `mqtt_factory` to use something other than
+    `paho.mqtt.client`.
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        host: Optional[str] = None,
+        port: int = MQTT_PORT,
+        topics: Optional[List[str]] = None,
+        tls: Optional[ssl.SSLContext] = None,
+        client_id: Optional[str] = None,
+        mqtt_factory: Optional[Callable[[str], Any]] = None,
+        state_path: Optional[str] = None,
+    ) -> None:
+        if mqtt_factory is None and paho_mqtt is None:
+            raise ImportError("MQTTFeed requires the paho-mqtt package")
+        self.client = client
+        self.host = host
+        self.port = port
+        self.topics: List[str] = list(topics or [])
+        self.tls = tls
+        self.client_id = client_id or core.gen_uuid()
+        self.mqtt_factory = mqtt_factory or self._paho_client
+        self.state_path = state_path
+        self._mqtt = None
+
+    @classmethod
+    def for_state_file(
+        cls, client: Client, state_file: str, **kwargs
+    ) -> "MQTTFeed":
+        """Get a feed keeping its registration next to a
+        `wideq_state.json` file.
+        """
+
+        directory = os.path.dirname(os.path.abspath(state_file))
+        return cls(
+            client,
+            state_path=os.path.join(directory, MQTT_STATE_FILE_NAME),
+            **kwargs,
+        )
+
+    @staticmethod
+    def _paho_client(client_id: str):
+        if hasattr(paho_mqtt, "CallbackAPIVersion"):
+            return paho_mqtt.Client(
+                paho_mqtt.CallbackAPIVersion.VERSION1, client_id=client_id
+            )
+        return paho_mqtt.Client(client_id=client_id)
+
+    @property
+    def connected(self) -> bool:
+        return self.client.push_connected
+
+    def register(self) -> None:
+        """Look up LG's broker and register a client certificate for it.
+
+        With a `state_path`, the registration is saved there.
+        """
+
+        private_key, csr = make_csr()
+        session = self.client.session
+        server = urlparse(session.get_route()["mqttServer"])
+        self.host = server.hostname
+        self.port = server.port or MQTT_PORT
+
+        session.register_client(self.client_id)
+        res = session.register_certificate(self.client_id, csr)
+        self.topics = list(res["subscriptions"])
+        self.tls = tls_context(res["certificatePem"], private_key)
+        self._save_registration(res["certificatePem"], private_key)
+
+    def _load_registration(self) -> bool:
+        """Use the registration saved at `state_path`, if there is one."""
+
+        if self.state_path is None:
+            return False
+        try:
+            with open(self.state_path) as f:
+                data = json.load(f)
+            tls = tls_context(data["certificate"], data["private_key"])
+            client_id = data["client_id"]
+            host = data["host"]
+            port = data["port"]
+            topics = list(data["topics"])
+        except FileNotFoundError:
+            return False
+        except (IOError, OSError, ValueError, KeyError, TypeError) as exc:
+            # `ssl.SSLError` is an `OSError`.
+            LOGGER.warning("Ignoring saved MQTT registration: %s", exc)
+            return False
+        self.client_id = client_id
+        self.host = host
+        self.port = port
+        self.topics = topics
+        self.tls = tls
+        return True
+
+    def _save_registration(self, certificate: str, private_key: str) -> None:
+        if self.state_path is None:
+            return
+        data = {
+            "client_id": self.client_id,
+            "host": self.host,
+            "port": self.port,
+            "topics": self.topics,
+            "certificate": certificate,
+            "private_key": private_key,
+        }
+        try:
+            # `mkstemp` creates the file readable by its owner only.
+            fd, tmp = tempfile.mkstemp(
+                dir=os.path.dirname(self.state_path), suffix=".tmp"
+            )
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.state_path)
+        except (IOError, OSError) as exc:
+            LOGGER.warning("Could not save MQTT registration: %s", exc)
+
+    def _forget_registration(self) -> None:
+        if self.state_path is None:
+            return
+        try:
+            os.remove(self.state_path)
+        except FileNotFoundError:
+            pass
+        except (IOError, OSError) as exc:
+            LOGGER.warning("Could not remove MQTT registration: %s", exc)
+
+    def start(self) -> None:
+        """Connect to the broker in the background. paho keeps
+        reconnecting until `stop` is called.
+        """
+
+        if self.host is None and not self._load_registration():
+            self.register()
+
+        mqtt = self.mqtt_factory(self.client_id)
+        mqtt.on_connect = self._on_connect
+        mqtt.on_disconnect = self._on_disconnect
+        mqtt.on_message = self._on_message
+        if self.tls is not None:
+            mqtt.tls_set_context(self.tls)
+        mqtt.connect_async(self.host, self.port, MQTT_KEEPALIVE)
+        mqtt.loop_start()
+        self._mqtt = mqtt
+
+    def stop(self) -> None:
+        if self._mqtt is not None:
+            self._mqtt.disconnect()
+            self._mqtt.loop_stop()
+            self._mqtt = None
+        self.client.push_connected = False
+
+    def __enter__(self) -> "MQTTFeed":
+        self.start()
+        return self
+
+    def __exit__(self, type, value, tb) -> None:
+        self.stop()
+
+    def _on_connect(self, mqtt, userdata, flags, rc) -> None:
+        if rc != 0:
+            LOGGER.warning("MQTT connection refused: %s", rc)
+            if rc in MQTT_AUTH_REFUSED:
+                # Register anew on the next start.
+                self._forget_registration()
+            return
+        for topic in self.topics:
+            mqtt.subscribe(topic, qos=1)
+        LOGGER.debug("MQTT connected to %s:%s", self.host, self.port)
+        # Pushes sent while we were away are lost; resynchronize once.
+        self.client.invalidate_snapshots()
+        self.client.push_connected = True
+
+    def _on_disconnect(self, mqtt, userdata, rc) -> None:
+        LOGGER.debug("MQTT disconnected: %s", rc)
+        self.client.push_connected = False
+
+    def _on_message(self, mqtt, userdata, message) -> None:
+        try:
+            self.handle_message(message.payload)
+        except Exception:
+            LOGGER.exception("Could not handle MQTT message")
+
+    def handle_message(self, payload: bytes) -> None:
+        """Merge the state reported in a pushed message into the
+        client's snapshot cache.
+        """
+
+        try:
+            data: Dict[str, Any] = json.loads(payload)
+        except ValueError:
+            LOGGER.debug("Ignoring non-JSON MQTT message")
+            return
+        if not isinstance(data, dict) or data.get("type") != "monitoring":
+            return
+        device_id = data.get("deviceId")
+        reported = data.get("data", {}).get("state", {}).get("reported")
+        if device_id and isinstance(reported, dict):
+            self.client.merge_snapshot(device_id, reported)
@@ -0,0 +1,147 @@
+"""A client-side rate limiter for API requests, shared between processes.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from . import core
+
+try:
+    import fcntl
+except ImportError:
+    # On Windows; the limit then only holds within this process.
+    fcntl = None  # type: ignore
+
+#: The file name used next to a state file, see `for_state_file`.
+RATE_LIMIT_FILE_NAME = "wideq_ratelimit.json"
+#: Requests per second allowed per account and endpoint class.
+RATE_LIMIT = 1.0
+#: How many requests may be made at once before the rate applies.
+RATE_BURST = 5
+#: Buckets unused for this long (in seconds) are dropped from the file.
+RATE_BUCKET_EXPIRY = 24 * 60 * 60
+
+LOGGER = logging.getLogger("wideq.ratelimit")
+
+
+class RateLimiter(object):
+    """Token buckets limiting the request rate per account and endpoint
+    class (see `core.endpoint_class`).
+
+    Each bucket holds up to `burst` tokens and refills at `rate` tokens
+    per second; every request takes one. A request finding its bucket
+    empty reserves the next token and waits for it, so bursts such as an
+    energy history backfill are spread out instead of crowding out
+    other requests.
+
+    The buckets are kept in the JSON file `path`, locked with `fcntl`
+    while they are updated, so all processes using the same file (the
+    plugin, example.py, energy_history2domoticz.py) share the limit.
+    Without `fcntl` or a `path`, only this process' requests are
+    counted.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        rate: float = RATE_LIMIT,
+        burst: float = RATE_BURST,
+    ) -> None:
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_state_file(cls, state_file: str) -> "RateLimiter":
+        """Get the limiter kept next to a `wideq_state.json` file."""
+
+        directory = os.path.dirname(os.path.abspath(state_file))
+        return cls(os.path.join(directory, RATE_LIMIT_FILE_NAME))
+
+    def _key(self, account: str, url: str) -> str:
+        return "{} {}".format(account, core.endpoint_class(url))
+
+    def _take(self, buckets: Dict[str, Any], key: str, now: float) -> float:
+        """Take a token from a bucket, returning how long to wait for
+        it. The bucket goes into debt for tokens not there yet.
+        """
+
+        tokens, updated = buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + max(now - updated, 0) * self.rate)
+        buckets[key] = (tokens - 1, now)
+        return max(1 - tokens, 0) / self.rate
+
+    def _update(self, key: str, max_wait: Optional[float]) -> float:
+        now = time.time()
+        if self.path is None or fcntl is None:
+            wait = self._take(self._buckets, key, now)
+            if max_wait is not None and wait > max_wait:
+                self._untake(self._buckets, key)
+            return wait
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        with os.fdopen(fd, "r+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                buckets = json.load(f)
+            except ValueError:
+                buckets = {}
+            wait = self._take(buckets, key, now)
+            if max_wait is not None and wait > max_wait:
+                self._untake(buckets, key)
+            for other in list(buckets):
+                if now - buckets[other][1] > RATE_BUCKET_EXPIRY:
+                    del buckets[other]
+            f.seek(0)
+            f.truncate()
+            json.dump(buckets, f)
+            f.flush()
+        return wait
+
+    @staticmethod
+    def _untake(buckets: Dict[str, Any], key: str) -> None:
+        tokens, updated = buckets[key]
+        buckets[key] = (tokens + 1, updated)
+
+    def reserve(
+        self, account: str, url: str, max_wait: Optional[float] = None
+    ) -> float:
+        """Reserve a request to `url` for the user `account`, and return
+        the seconds to wait before sending it.
+
+        If the wait would be longer than `max_wait`, nothing is reserved.
+        """
+
+        key = self._key(account, url)
+        with self._lock:
+            try:
+                return self._update(key, max_wait)
+            except (IOError, OSError) as exc:
+                LOGGER.warning("Could not use rate limit file: %s", exc)
+                self.path = None
+                return self._update(key, max_wait)
+
+    def acquire(
+        self,
+        account: str,
+        url: str,
+        deadline: Optional[core.Deadline] = None,
+    ) -> None:
+        """Wait until a request to `url` for the user `account` may be
+        sent, within `deadline` (by default the current thread's).
+
+        :raises DeadlineExceededError: If the wait would outlast the
+            deadline.
+        :raises RequestCancelledError: If the deadline was cancelled.
+        """
+
+        deadline = deadline or core.current_deadline() or core.Deadline()
+        wait = self.reserve(account, url, deadline.remaining())
+        if wait > 0:
+            LOGGER.debug("Rate limited, waiting %.1fs", wait)
+            deadline.sleep(wait)
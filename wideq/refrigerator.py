@@ -40,12 +40,13 @@ class RefrigeratorDevice(Device):
     def set_temp_refrigerator_c(self, temp):
         """Set the refrigerator temperature in Celsius."""
         value = self.model.enum_value("TempRefrigerator", str(temp))
-        self._set_control("RETM", value)
+        # The command key differs from the model key `enum_value` checked.
+        self._set_control("RETM", value, validate=False)
 
     def set_temp_freezer_c(self, temp):
         """Set the freezer temperature in Celsius."""
         value = self.model.enum_value("TempFreezer", str(temp))
-        self._set_control("REFT", value)
+        self._set_control("REFT", value, validate=False)
 
     def poll(self) -> Optional["RefrigeratorStatus"]:
         """Poll the device's current state.